@@ -0,0 +1,146 @@
+#! python3
+
+import datetime
+
+import pytz
+
+from color import BLUE
+
+
+class AdaptiveInterval:
+    '''
+    Polling interval for the current power flow, to use the daily request budget where it matters
+
+    - Night (dusk to dawn): solar is zero, poll slowly
+    - Day: poll faster when power flow values change quickly (volatility is an
+      exponential moving average of the largest change between two samples)
+    - Budget: never poll faster than the requests left for today allow, the
+      requests needed for the rest of the night are kept aside. The token
+      bucket of the budget is taken into account as well (requests saved at
+      night can only be used during the day up to its burst).
+
+    Use an instance as the interval of a PollingEngine job, call update after
+    every sample.
+    '''
+    def __init__(self, budget, sun_times, tz, lat, lon, min_interval=30, max_interval=300, night_interval=1800,
+                 threshold=0.5, smoothing=0.3, reserve=20, requests_per_poll=1, verbose=True, info=False, debug=False):
+        '''
+        Arguments
+        ---------
+        budget          (RequestBudget) : see SolarEdgeConnector.budget
+        sun_times       (SolarTimes)
+        tz              (string)        : site timezone (pytz format)
+        lat             (float)         : site latitude [°]
+        lon             (float)         : site longitude [°]
+        min_interval    (float)         : interval when values change quickly [s]
+        max_interval    (float)         : interval when values are stable (daytime) [s]
+        night_interval  (float)         : interval between dusk and dawn [s]
+        threshold       (float)         : volatility at which min_interval is used [kW]
+        smoothing       (float)         : weight of the newest change in the volatility (0-1)
+        reserve         (int)           : requests left for other scripts (main.py, service.py)
+        requests_per_poll (float)       : API requests done per poll
+        '''
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        self.budget = budget
+        self.sun_times = sun_times
+        self.tz = tz
+        self.lat = lat
+        self.lon = lon
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.night_interval = night_interval
+        self.threshold = threshold
+        self.smoothing = smoothing
+        self.reserve = reserve
+        self.requests_per_poll = requests_per_poll
+
+        # Volatility
+        self.previous = None
+        self.volatility = 0
+
+        # Last calculated interval
+        self.interval = None
+
+
+    def update(self, component_power):
+        '''
+        Arguments
+        ---------
+        component_power (dict)  : {component : power [kW]}, see SolarEdgeConnector.get_site_power_flow
+        '''
+        if self.previous != None:
+            change = max([abs(component_power[key] - self.previous[key]) for key in component_power if key in self.previous], default=0)
+            self.volatility = self.smoothing * change + (1 - self.smoothing) * self.volatility
+
+            # Print debug
+            if self.debug:
+                print('Power flow change: %.2f kW, volatility: %.2f kW' % (change, self.volatility))
+
+        self.previous = dict(component_power)
+
+
+    def __call__(self):
+        '''
+        Returns
+        -------
+        interval    (float) : time until the next request [s]
+        '''
+        local_tz = pytz.timezone(self.tz)
+        now = datetime.datetime.now(tz=local_tz)
+        today = now.date()
+
+        # Daily budget resets at midnight in the timezone of the budget (see RequestBudget)
+        budget_tz = pytz.timezone(self.budget.tz)
+        budget_now = now.astimezone(budget_tz)
+        midnight = budget_tz.localize(datetime.datetime.combine(budget_now.date() + datetime.timedelta(days=1), datetime.time()))
+
+        sun_times = self.sun_times.get_times(tz=self.tz, lat=self.lat, lon=self.lon, date=today)
+        dawn = sun_times['dawn'].astimezone(local_tz)
+        dusk = sun_times['dusk'].astimezone(local_tz)
+        is_day = dawn <= now < dusk
+
+        # Time left until the budget resets, during the day and at night
+        time_left = (midnight - now).total_seconds()
+        day_left = max(0, (min(dusk, midnight) - max(now, dawn)).total_seconds())
+        night_left = time_left - day_left
+
+        # Polls that can be done until midnight (daily quota and token bucket)
+        tokens = self.budget.tokens()
+        requests_left = min(self.budget.remaining() - self.reserve, tokens + self.budget.rate * time_left)
+        polls_left = requests_left / self.requests_per_poll
+        night_polls = night_left / self.night_interval
+
+        if is_day:
+            # Faster when values change quickly
+            fraction = min(1, self.volatility / self.threshold)
+            interval = self.max_interval - fraction * (self.max_interval - self.min_interval)
+
+            # Requests left after the night, spread over the rest of the day
+            budget_interval = day_left / max(1, polls_left - night_polls)
+        else:
+            # Slow, but wake up at dawn
+            interval = self.night_interval
+            if now < dawn:
+                interval = max(self.min_interval, min(interval, (dawn - now).total_seconds()))
+
+            budget_interval = night_left / max(1, polls_left)
+
+        # Wait for a token if the bucket is empty
+        if tokens < self.requests_per_poll:
+            budget_interval = max(budget_interval, (self.requests_per_poll - tokens) / self.budget.rate)
+
+        interval = max(interval, budget_interval)
+
+        # Print info
+        if self.info and (self.interval == None or abs(interval - self.interval) >= 1):
+            print(BLUE + 'Polling interval: %d s (%s, volatility %.2f kW, %d requests left, budget allows %d s)'
+                  % (interval, 'day' if is_day else 'night', self.volatility, requests_left, budget_interval))
+
+        self.interval = interval
+
+        return interval
@@ -0,0 +1,52 @@
+#! python3
+
+# Benchmark: predicted production in time windows
+# closed form (LocalForecast.energy_between) vs integrate.quad over interp1d
+
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import integrate
+import scipy.interpolate
+
+from color import BLUE
+from forecast import LocalForecast
+
+number_of_windows = 100
+
+# One day of 15 minute forecast data
+time = pd.date_range('2021-08-04', periods=96, freq='15min', tz='Europe/Brussels')
+most_recent_forecast = np.maximum(0, np.sin(np.linspace(-1.5, 4.6, len(time)))) * 3000
+monitored_capacity = np.full(len(time), 6000.0)
+data = {'time': time, 'MostRecentForecast': most_recent_forecast, 'MonitoredCapacity': monitored_capacity}
+
+local_forecast = LocalForecast(data, local_capacity=10, verbose=False)
+
+# Random windows within the day
+rng = np.random.default_rng(0)
+offsets = np.sort(rng.uniform(0, local_forecast.elapsed_s[-1], (number_of_windows, 2)), axis=1)
+t0 = time[0] + pd.to_timedelta(offsets[:, 0], unit='s')
+t1 = time[0] + pd.to_timedelta(offsets[:, 1], unit='s')
+
+
+def quad():
+    f = scipy.interpolate.interp1d(local_forecast.elapsed_s, local_forecast.power, kind='linear')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return np.array([integrate.quad(f, start, end)[0] for start, end in offsets]) / 3600
+
+
+def closed_form():
+    return local_forecast.energy_between(t0, t1)
+
+
+if __name__ == '__main__':
+    error = np.max(np.abs(quad() - closed_form()))
+
+    print(BLUE + 'Production in %d time windows (96 forecast values)' % number_of_windows)
+    for name, function in [('integrate.quad', quad), ('closed form', closed_form)]:
+        duration = min(timeit.repeat(function, number=1, repeat=3))
+        print('%s %10.2f ms' % (name.ljust(16), duration * 1e3))
+    print('Max difference: %.2e kWh' % error)
@@ -0,0 +1,45 @@
+#! python3
+
+# Benchmark: import time of the modules used by each entry point
+# (fresh interpreter per measurement, median of several runs)
+
+import sys
+import time
+import statistics
+import subprocess
+
+from color import BLUE
+
+runs = 5
+
+# Entry point : modules imported at start (entry points run at import, so their modules are imported instead)
+entry_points = {
+    'loop.py':    ['solaredge', 'elia', 'solar', 'plc', 'poller', 'adaptive'],
+    'main.py':    ['engine', 'plot'],
+    'test.py':    ['solaredge', 'plot'],
+    'service.py': ['engine'],
+}
+
+
+def import_time(modules):
+    '''
+    Returns
+    -------
+    duration    (float) : median wall time of starting python and importing modules [s]
+    '''
+    command = [sys.executable, '-c', 'import ' + ', '.join(modules)]
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+if __name__ == '__main__':
+    baseline = import_time(['sys'])
+
+    print(BLUE + 'Startup time (median of %d runs)' % runs)
+    print('%s %6.0f ms' % ('python'.ljust(12), baseline * 1e3))
+    for entry_point, modules in entry_points.items():
+        print('%s %6.0f ms' % (entry_point.ljust(12), import_time(modules) * 1e3))
@@ -0,0 +1,62 @@
+#! python3
+
+# Benchmark: compiled layout codec (plc_codec) vs snap7.util.DB
+# Encodes and decodes the whole DB99 layout, no PLC needed.
+
+import timeit
+
+try:
+    from snap7.util import DB
+except ImportError: # python-snap7 >= 2
+    from snap7 import DB
+
+from color import BLUE
+from plc_codec import compile_layout
+from plc_db_layouts import db99_layout
+
+size = 446
+number = 2000
+
+layout = compile_layout(db99_layout)
+values = {name: {'INT': 1, 'TIME': 0}.get(type, 1.5) for name, type in layout.types.items()}
+
+# TIME values are set differently in each snap7 version (string/timedelta), left at 0
+snap7_values = {name: value for name, value in values.items() if layout.types[name] != 'TIME'}
+
+# Not all snap7 versions strip trailing comments from a specification
+snap7_layout = '\n'.join(line.split('#')[0] for line in db99_layout.splitlines())
+
+
+def snap7_decode():
+    db = DB(99, bytearray(size), snap7_layout, size, 1, layout_offset=0, db_offset=0)
+    row = next(iter(db.index.values())) # first (only) row
+    return {name: row[name] for name in values}
+
+
+def snap7_encode():
+    db = DB(99, bytearray(size), snap7_layout, size, 1, layout_offset=0, db_offset=0)
+    row = next(iter(db.index.values())) # first (only) row
+    for name, value in snap7_values.items():
+        row[name] = value
+    return db._bytearray
+
+
+def codec_decode():
+    return compile_layout(db99_layout).unpack_from(bytearray(size))
+
+
+def codec_encode():
+    data = bytearray(size)
+    compile_layout(db99_layout).pack_into(data, values)
+    return data
+
+
+if __name__ == '__main__':
+    # Both paths must produce the same bytes
+    assert bytes(snap7_encode()) == bytes(codec_encode())
+
+    print(BLUE + 'DB99 layout (%d fields, %d bytes), %d iterations' % (len(values), size, number))
+    for name, function in [('snap7.util.DB decode', snap7_decode), ('plc_codec decode', codec_decode),
+                           ('snap7.util.DB encode', snap7_encode), ('plc_codec encode', codec_encode)]:
+        duration = min(timeit.repeat(function, number=number, repeat=3)) / number
+        print('%s %8.1f us' % (name.ljust(22), duration * 1e6))
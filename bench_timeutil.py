@@ -0,0 +1,50 @@
+#! python3
+
+# Micro-benchmark: localizing SolarEdge timestamps per entry vs all at once
+#   py bench_timeutil.py
+
+import time
+import datetime
+
+import pytz
+
+from color import BLUE, GREEN
+from timeutil import localize
+
+tz = 'Europe/Brussels'
+
+# One month of 15 minute data (as returned by the API)
+start = datetime.datetime(2021, 10, 1)
+strings = [(start + datetime.timedelta(minutes=15*i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(31*96)]
+
+
+def per_entry():
+    times = []
+    for string in strings:
+        unaware_dt = datetime.datetime.strptime(string, '%Y-%m-%d %H:%M:%S')
+        times.append(pytz.timezone(tz).localize(unaware_dt))
+    return times
+
+
+def at_once():
+    return localize(strings, tz)
+
+
+def benchmark(function, repeat=20):
+    function() # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    assert per_entry() == at_once()
+
+    t_per_entry = benchmark(per_entry)
+    t_at_once = benchmark(at_once)
+
+    print(BLUE + 'Localize %d timestamps' % len(strings))
+    print('Per entry (strptime + pytz): %.2f ms' % (t_per_entry*1000))
+    print('At once (timeutil):          %.2f ms' % (t_at_once*1000))
+    print(GREEN + 'Speedup: %.1fx' % (t_per_entry/t_at_once))
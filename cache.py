@@ -0,0 +1,139 @@
+#! python3
+
+import os
+import re
+import time
+import pickle
+
+
+class FileCache:
+    '''
+    Persistent on-disk cache for parsed API responses
+
+    One pickle file per key. Entries either expire after a time-to-live or are
+    kept permanently (e.g. data for past days that never changes again).
+    When the total size of the cache exceeds max_size, the least recently
+    used entries are removed.
+    '''
+    def __init__(self, directory, max_size=50*1024*1024):
+        '''
+        Arguments
+        ---------
+        directory   (string)    : folder in which cache files are stored
+        max_size    (int)       : maximum total size of all cache files [bytes]
+        '''
+        self.directory = directory
+        self.max_size = max_size
+
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def _path(self, key):
+        '''
+        Arguments
+        ---------
+        key     (tuple)     : cache key, e.g. (method, date_from, date_to, region)
+
+        Returns
+        -------
+        path    (string)    : file path of the cache entry
+        '''
+        name = '_'.join(str(part) for part in key)
+        name = re.sub(r'[^A-Za-z0-9_.-]', '-', name) # safe file name
+        return os.path.join(self.directory, name + '.pickle')
+
+
+    def get(self, key):
+        '''
+        Arguments
+        ---------
+        key     (tuple)
+
+        Returns
+        -------
+        data    : cached data, None if not cached or expired
+        '''
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Unreadable entry (partial file, written by other library versions): cache miss
+            self._remove(path)
+            return None
+
+        # Expired
+        if entry['expires'] != None and entry['expires'] < time.time():
+            self._remove(path)
+            return None
+
+        # Mark as recently used (for eviction)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return entry['data']
+
+
+    def set(self, key, data, ttl=None):
+        '''
+        Arguments
+        ---------
+        key     (tuple)
+        data            : any picklable object
+        ttl     (float) : time to live [s], None = permanent
+        '''
+        entry = {}
+        entry['expires'] = None if ttl == None else time.time() + ttl
+        entry['data'] = data
+
+        # Write to temporary file first, so readers never see a partial file
+        path = self._path(key)
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp_path, 'wb') as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+        self._evict()
+
+
+    def clear(self):
+        '''
+        Remove all cache entries
+        '''
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+
+    def _evict(self):
+        '''
+        Remove least recently used entries until cache fits within max_size
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pickle'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, name in sorted(entries): # oldest first
+            if total_size <= self.max_size:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total_size -= size
+
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
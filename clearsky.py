@@ -0,0 +1,175 @@
+#! python3
+
+import numpy as np
+
+from color import GREEN, BLUE
+
+
+class ClearSkyModel:
+    '''
+    Expected PV output on a clear day
+
+    Solar position from the NOAA approximation (fractional year), clear-sky
+    irradiance from the Meinel air mass model (direct normal irradiance, with
+    10% diffuse light) and plane of array irradiance with an isotropic sky.
+    Everything is calculated on NumPy arrays, so any number of timestamps is
+    calculated in one call.
+
+    Clouds, temperature and system losses are not taken into account, so the
+    result is an upper bound for the actual production.
+    '''
+    def __init__(self, lat, lon, peak_power, tilt=0, azimuth=180, albedo=0.2, verbose=True, info=False, debug=False):
+        '''
+        Arguments
+        ---------
+        lat         (float) : latitude [°]
+        lon         (float) : longitude [°]
+        peak_power  (float) : [kWp], at 1000 W/m²
+        tilt        (float) : panel tilt, 0 = horizontal [°]
+        azimuth     (float) : panel orientation, 180 = south [°]
+        albedo      (float) : ground reflectance
+        '''
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        # Site
+        self.lat = lat
+        self.lon = lon
+        self.peak_power = peak_power
+        self.tilt = tilt
+        self.azimuth = azimuth
+        self.albedo = albedo
+
+
+    def solar_position(self, time):
+        '''
+        Arguments
+        ---------
+        time    (pandas.DatetimeIndex or list)  : timezone aware
+
+        Returns
+        -------
+        zenith  (numpy.ndarray) : [°]
+        azimuth (numpy.ndarray) : clockwise from north [°]
+        '''
+        import pandas as pd
+
+        time = pd.DatetimeIndex(time).tz_convert('UTC')
+        hour = time.hour.values + time.minute.values/60 + time.second.values/3600
+
+        # Fractional year [rad]
+        gamma = 2*np.pi/365 * (time.dayofyear.values - 1 + (hour - 12)/24)
+
+        # Equation of time [min] and declination [rad]
+        eqtime = 229.18 * (0.000075 + 0.001868*np.cos(gamma) - 0.032077*np.sin(gamma)
+                           - 0.014615*np.cos(2*gamma) - 0.040849*np.sin(2*gamma))
+        decl = (0.006918 - 0.399912*np.cos(gamma) + 0.070257*np.sin(gamma)
+                - 0.006758*np.cos(2*gamma) + 0.000907*np.sin(2*gamma)
+                - 0.002697*np.cos(3*gamma) + 0.00148*np.sin(3*gamma))
+
+        # Hour angle [rad] from true solar time [min]
+        true_solar_time = hour*60 + eqtime + 4*self.lon
+        hour_angle = np.radians(true_solar_time/4 - 180)
+
+        lat = np.radians(self.lat)
+        cos_zenith = np.sin(lat)*np.sin(decl) + np.cos(lat)*np.cos(decl)*np.cos(hour_angle)
+        zenith = np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+
+        azimuth = np.degrees(np.arctan2(np.sin(hour_angle),
+                                        np.cos(hour_angle)*np.sin(lat) - np.tan(decl)*np.cos(lat))) + 180
+
+        return zenith, azimuth
+
+
+    def irradiance(self, time):
+        '''
+        Arguments
+        ---------
+        time    (pandas.DatetimeIndex or list)  : timezone aware
+
+        Returns
+        -------
+        irradiance  (dict)  : {'dni': direct normal, 'dhi': diffuse horizontal,
+                               'ghi': global horizontal, 'poa': plane of array} [W/m²]
+        '''
+        zenith, azimuth = self.solar_position(time)
+
+        # Air mass (Kasten-Young), sun below horizon has no irradiance
+        up = zenith < 90
+        cos_zenith = np.cos(np.radians(zenith))
+        air_mass = np.full(len(zenith), np.inf)
+        air_mass[up] = 1 / (cos_zenith[up] + 0.50572*(96.07995 - zenith[up])**-1.6364)
+
+        # Clear sky (Meinel)
+        dni = 1353 * 0.7**(air_mass**0.678)
+        dhi = 0.1 * dni
+        ghi = dni*cos_zenith.clip(0) + dhi
+
+        # Plane of array (isotropic sky)
+        tilt = np.radians(self.tilt)
+        cos_incidence = (cos_zenith*np.cos(tilt)
+                         + np.sin(np.radians(zenith))*np.sin(tilt)*np.cos(np.radians(azimuth - self.azimuth)))
+        poa = (dni*cos_incidence.clip(0)
+               + dhi*(1 + np.cos(tilt))/2
+               + ghi*self.albedo*(1 - np.cos(tilt))/2)
+
+        return {'dni': dni, 'dhi': dhi, 'ghi': ghi, 'poa': poa}
+
+
+    def power(self, time):
+        '''
+        Arguments
+        ---------
+        time    (pandas.DatetimeIndex or list)  : timezone aware
+
+        Returns
+        -------
+        power   (numpy.ndarray) : expected clear-sky PV output [kW]
+        '''
+        return self.peak_power * self.irradiance(time)['poa'] / 1000
+
+
+    def cap(self, time, power, margin=1.1):
+        '''
+        Limit predicted power to the clear-sky output
+
+        Arguments
+        ---------
+        time    (pandas.DatetimeIndex or list)  : timezone aware
+        power   (numpy.ndarray) : predicted power [kW]
+        margin  (float)         : allowed factor above the clear-sky output
+
+        Returns
+        -------
+        power   (numpy.ndarray) : capped power [kW]
+        '''
+        power = np.asarray(power, dtype=float)
+        limit = self.power(time) * margin
+        capped = power > limit
+
+        # Print info
+        if self.info:
+            print(BLUE + 'Clear Sky Check')
+            print('Values above clear-sky output: %d of %d' % (np.count_nonzero(capped), len(power)))
+            if capped.any():
+                print('Largest excess: %.2f kW' % (power - limit).max())
+
+        return np.where(capped, limit, power)
+
+
+if __name__ == '__main__':
+    from elia import EliaConnector
+    from forecast import LocalForecast
+
+    # Elia forecast of one day, scaled to 10 kWp, compared to clear sky
+    ec = EliaConnector(verbose=False)
+    data = ec.get_chart_data('2021-08-03', '2021-08-04', region=5, tz='Europe/Brussels')
+    local_forecast = LocalForecast(data, 10, verbose=False)
+
+    csm = ClearSkyModel(lat=51.197567558420694, lon=4.716483482278131, peak_power=10, tilt=35, verbose=False, info=True)
+    print('Clear sky peak: %.2f kW' % csm.power(local_forecast.time).max())
+    print('Forecast peak:  %.2f kW' % local_forecast.power.max())
+    csm.cap(local_forecast.time, local_forecast.power)
+    print(GREEN + 'Done')
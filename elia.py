@@ -1,23 +1,34 @@
 #! python3
 
-from collections import defaultdict
+import io
+import re
 import datetime
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 import urllib3
 urllib3.disable_warnings()
-import xmltodict
 import pytz
-import pandas as pd
 
 from color import GREEN, BLUE
+from cache import FileCache
 
 
 class EliaConnector:
     '''
     Connect and make requests to Elia API
     '''
-    def __init__(self, verbose=True, info=False, debug=False):
+    def __init__(self, verbose=True, info=False, debug=False, cache=True, cache_ttl=15*60, max_workers=4):
+        '''
+        Arguments
+        ---------
+        cache       (bool)  : keep responses in a local on-disk cache
+        cache_ttl   (float) : time to live of cached forecasts for today and future days [s]
+                              (forecasts for past days never change and are cached permanently)
+        max_workers (int)   : maximum number of concurrent requests (bulk requests)
+        '''
         # API self.root
         self.root = 'https://publications.elia.be/Publications/publications/solarforecasting.v4.svc/'
 
@@ -26,6 +37,16 @@ class EliaConnector:
         self.info = info
         self.debug = debug
 
+        # Cache
+        self.cache = FileCache('cache/elia') if cache else None
+        self.cache_format = 2 # increase when format of returned data changes
+        self.cache_ttl = cache_ttl
+
+        # HTTP session (connection pool shared by all requests)
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
 
     def get_chart_data(self, date_from, date_to, region, tz):
         '''
@@ -38,47 +59,90 @@ class EliaConnector:
 
         Returns
         -------
-        data    (defaultdict)   : {datetime (timezone aware) : value}
+        data    (dict)  : {'time'               : timestamps (pandas.DatetimeIndex, timezone aware),
+                           'MostRecentForecast' : forecasted power (numpy.ndarray, float64) [MW],
+                           'MonitoredCapacity'  : monitored capacity (numpy.ndarray, float64) [MWp]}
         '''
         # Progress print
         if self.verbose:
             print('Getting prediction data... ', end='')
 
-        # Build request
-        method = 'GetChartDataForZoneXml'
-        parameters = 'dateFrom=' + date_from + '&dateTo=' + date_to + '&sourceId=' + str(region)
-        url = self.root + method + '?' + parameters
+        # Get data (from cache or API)
+        data = self._get_chart_data(date_from, date_to, region, tz)
 
-        # Do request
-        response = requests.get(url, verify=False)
+        # Print info
+        if self.info:
+            import pandas as pd
+            df = pd.DataFrame(data)
+            df.set_index('time', inplace=True)
+            print('\n' + BLUE + 'Elia Data')
+            print(df.to_string())
 
-        # XML to JSON
-        json_data = xmltodict.parse(response.text)
+        # Progress print
+        if self.verbose:
+            print(GREEN + 'Done')
 
-        # Save data to lists (in one dict, key = column name)
-        time = []
-        data = defaultdict(list)
+        # Return results
+        return data
 
-        for entry in json_data['SolarForecastingChartDataForZone']['SolarForecastingChartDataForZoneItems']['SolarForecastingChartDataForZoneItem']:
-            # Get time as datetime
-            time_data = entry['StartsOn']['a:DateTime']
-            format = '%Y-%m-%dT%H:%M:%SZ'
-            time_datetime = datetime.datetime.strptime(time_data, format)
 
-            # Convert timezone
-            time_datetime_utc = pytz.utc.localize(time_datetime) # make datetime timezone aware
-            local_tz = pytz.timezone(tz) # target timezone
-            time_datetime_bru = time_datetime_utc.astimezone(local_tz) # convert to timezone
+    def get_chart_data_bulk(self, date_from, date_to, regions, tz, chunk_days=7):
+        '''
+        Get chart data for a long date range and/or multiple regions
 
-            data['time'].append(time_datetime_bru)
-            data['MostRecentForecast'].append(float(entry['MostRecentForecast']))
-            #data['RealTime'].append(float(entry['RealTime']))
-            data['MonitoredCapacity'].append(float(entry['MonitoredCapacity']))
+        The date range is split into chunks, which are requested concurrently
+        (at most max_workers at a time). Results are combined into one frame.
+
+        Arguments
+        ---------
+        date_from   (string)    : YYYY-MM-DD
+        date_to     (string)    : YYYY-MM-DD
+        regions     (list)      : region numbers as specified by Elia
+        tz          (string)    : timezone data will be converted to (pytz format)
+        chunk_days  (int)       : number of days per request
+
+        Returns
+        -------
+        df  (pandas.DataFrame)  : index (region, time), columns MostRecentForecast and MonitoredCapacity,
+                                  sorted by time and without duplicate timestamps
+        '''
+        import pandas as pd
+
+        # Progress print
+        if self.verbose:
+            print('Getting prediction data (bulk)... ', end='')
+
+        # Split date range in chunks
+        start = datetime.datetime.strptime(date_from, '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(date_to, '%Y-%m-%d').date()
+
+        chunks = []
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + datetime.timedelta(days=chunk_days), end)
+            chunks.append((chunk_start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+            chunk_start = chunk_end
+
+        # Do requests (concurrently)
+        requests_todo = [(chunk_from, chunk_to, region) for region in regions for chunk_from, chunk_to in chunks]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda request: self._get_chart_data(*request, tz), requests_todo)
+
+            # Combine results
+            frames = []
+            for (_, _, region), data in zip(requests_todo, results):
+                df = pd.DataFrame(data)
+                df.insert(0, 'region', region)
+                frames.append(df)
+
+        df = pd.concat(frames, ignore_index=True)
+        df.drop_duplicates(subset=['region', 'time'], keep='last', inplace=True) # chunks overlap at their borders
+        df.set_index(['region', 'time'], inplace=True)
+        df.sort_index(inplace=True)
 
         # Print info
         if self.info:
-            df = pd.DataFrame(data)
-            df.set_index('time', inplace=True)
             print('\n' + BLUE + 'Elia Data')
             print(df.to_string())
 
@@ -87,6 +151,133 @@ class EliaConnector:
             print(GREEN + 'Done')
 
         # Return results
+        return df
+
+
+    def _get_chart_data(self, date_from, date_to, region, tz):
+        '''
+        Get chart data from cache, or request it from Elia API
+
+        Arguments
+        ---------
+        see get_chart_data
+
+        Returns
+        -------
+        data    (dict)  : see get_chart_data
+        '''
+        # Build request
+        method = 'GetChartDataForZoneXml'
+        parameters = 'dateFrom=' + date_from + '&dateTo=' + date_to + '&sourceId=' + str(region)
+        url = self.root + method + '?' + parameters
+
+        # Check cache
+        cache_key = (method, date_from, date_to, region, tz, self.cache_format)
+        entry = self.cache.get(cache_key) if self.cache != None else None
+
+        if entry != None:
+            return self._from_cache_entry(entry, tz)
+
+        # Do request
+        data = self._request_chart_data(url, tz)
+
+        # Save to cache (permanently if the whole range lies in the past)
+        if self.cache != None:
+            today = datetime.datetime.now(pytz.timezone(tz)).date()
+            if datetime.datetime.strptime(date_to, '%Y-%m-%d').date() < today:
+                self.cache.set(cache_key, self._to_cache_entry(data))
+            else:
+                self.cache.set(cache_key, self._to_cache_entry(data), ttl=self.cache_ttl)
+
+        return data
+
+
+    def _to_cache_entry(self, data):
+        # Timestamps as int64 (UTC nanoseconds) instead of pandas objects, so entries survive pandas upgrades
+        import numpy as np
+
+        entry = dict(data)
+        entry['time'] = np.asarray(data['time'].tz_convert('UTC').tz_localize(None), dtype='datetime64[ns]').astype(np.int64)
+        return entry
+
+
+    def _from_cache_entry(self, entry, tz):
+        import pandas as pd
+
+        data = dict(entry)
+        data['time'] = pd.to_datetime(entry['time'], unit='ns', utc=True).tz_convert(tz)
+        return data
+
+
+    def _request_chart_data(self, url, tz):
+        '''
+        Request and parse chart data from Elia API
+
+        Arguments
+        ---------
+        url     (string)    : request url
+        tz      (string)    : timezone data will be converted to (pytz format)
+
+        Returns
+        -------
+        data    (dict)  : {column name : values}, see get_chart_data
+        '''
+        # Do request
+        response = self.session.get(url, verify=False)
+
+        # Parse XML
+        return self._parse_chart_data(response.content, tz)
+
+
+    def _parse_chart_data(self, content, tz):
+        '''
+        Parse GetChartDataForZoneXml response
+
+        The XML is streamed (iterparse) into preallocated arrays, timestamps are
+        converted to the target timezone in one step afterwards.
+
+        Arguments
+        ---------
+        content (bytes)     : XML response body
+        tz      (string)    : timezone data will be converted to (pytz format)
+
+        Returns
+        -------
+        data    (dict)  : {column name : values}, see get_chart_data
+        '''
+        import numpy as np
+        import pandas as pd
+
+        # Preallocate arrays (one entry per item)
+        nr_of_items = len(re.findall(rb'</(?:\w+:)?SolarForecastingChartDataForZoneItem>', content))
+        time = np.empty(nr_of_items, dtype='datetime64[s]')
+        most_recent_forecast = np.full(nr_of_items, np.nan)
+        monitored_capacity = np.full(nr_of_items, np.nan)
+
+        # Stream XML
+        i = 0
+        for _, element in ElementTree.iterparse(io.BytesIO(content)):
+            tag = element.tag.rpartition('}')[2] # strip namespace
+
+            if tag == 'StartsOn':
+                time[i] = element.find('{*}DateTime').text.rstrip('Z') # UTC
+            elif tag == 'MostRecentForecast' and element.text:
+                most_recent_forecast[i] = element.text
+            elif tag == 'MonitoredCapacity' and element.text:
+                monitored_capacity[i] = element.text
+            elif tag == 'SolarForecastingChartDataForZoneItem':
+                element.clear() # free memory of parsed item
+                i += 1
+
+        # Convert timezone (all at once)
+        time = pd.DatetimeIndex(time[:i]).tz_localize('UTC').tz_convert(tz)
+
+        # Save data to arrays (in one dict, key = column name)
+        data = {}
+        data['time'] = time
+        data['MostRecentForecast'] = most_recent_forecast[:i]
+        data['MonitoredCapacity'] = monitored_capacity[:i]
+
         return data
 
 
@@ -0,0 +1,246 @@
+#! python3
+
+import datetime
+
+import pytz
+
+from color import BLUE, GREEN
+from elia import EliaConnector
+from solaredge import SolarEdgeConnector
+from solar import SolarTimes
+from forecast import LocalForecast
+from store import TimeSeriesStore
+from planner import FetchPlanner
+
+
+class SolarEngine:
+    '''
+    Forecast and actuals for any date
+
+    Connectors and site metadata are created once and reused, so a long
+    running process (see service.py) can serve repeated requests without
+    paying imports, credential loading and the sites list request again.
+    '''
+    def __init__(self, tz='Europe/Brussels', region=5, lat=51.197567558420694, lon=4.716483482278131, sites=None,
+                 verbose=True, info=False, debug=False):
+        '''
+        Arguments
+        ---------
+        tz      (string)    : local timezone (pytz format)
+        region  (int)       : Elia region number
+        lat     (float)     : latitude of the site
+        lon     (float)     : longitude of the site
+        sites   (list)      : site metadata (SolarEdgeConnector.sites) loaded elsewhere,
+                              the sites list is not requested again
+        '''
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        # Site
+        self.tz = tz
+        self.local_tz = pytz.timezone(tz)
+        self.region = region
+        self.lat = lat
+        self.lon = lon
+
+        # Connectors
+        self.sec = SolarEdgeConnector(tz=tz, verbose=False)
+        self.ec = EliaConnector(verbose=False)
+        self.st = SolarTimes(verbose=False)
+        self.store = TimeSeriesStore(tz=tz, verbose=False)
+
+        # Site metadata (loaded on first run, unless given)
+        self.sites_loaded = False
+        if sites != None:
+            self.sec.sites = sites
+            self.sec.nr_of_sites = len(sites)
+            self.sites_loaded = True
+
+
+    def run(self, date, elia_data=None):
+        '''
+        Get forecast and actuals for one date
+
+        Arguments
+        ---------
+        date        (date)
+        elia_data   (dict)  : Elia chart data of the date (see EliaConnector.get_chart_data),
+                              requested if None
+
+        Returns
+        -------
+        result  (dict)  : {'date'                    : date,
+                           'time_view'               : 'past'/'today'/'future',
+                           'local_capacity'          : [kWp],
+                           'sun_times'               : see SolarTimes.get_times,
+                           'forecast'                : LocalForecast,
+                           'predicted_total_kwh'     : [kWh],
+                           'predicted_current_power' : [kW] (today),
+                           'predicted_current_kwh'   : [kWh] (today),
+                           'actual'                  : see SolarEdgeConnector.get_site_power (past, today),
+                           'actual_current_power'    : [kW] (today),
+                           'actual_current_kwh'      : [kWh] (today),
+                           'actual_last_updated'     : datetime (today),
+                           'actual_total_kwh'        : [kWh] (past)}
+        '''
+        result = {}
+        result['date'] = date
+
+        #----------------------------- Time Range -----------------------------#
+
+        today = datetime.datetime.now(tz=self.local_tz).date()
+
+        if date == today:  time_view = 'today'
+        elif date > today: time_view = 'future'
+        elif date < today: time_view = 'past'
+
+        result['time_view'] = time_view
+
+        #----------------------------- Fetch Data -----------------------------#
+
+        # Independent requests run concurrently, only the SolarEdge requests wait for the sites list
+        planner = FetchPlanner(verbose=self.verbose, info=self.info)
+
+        # Elia forecast data
+        date_from = date.strftime('%Y-%m-%d')
+        date_to = (date + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        if elia_data == None:
+            planner.add('Elia', lambda: self.ec.get_chart_data(date_from, date_to, region=self.region, tz=self.tz))
+
+        # Sun info
+        planner.add('Sun', lambda: self.st.get_times(tz=self.tz, lat=self.lat, lon=self.lon, date=date))
+
+        # SolarEdge peak power (only once)
+        sites = []
+        if not self.sites_loaded:
+            planner.add('Sites', self.sec.get_sites_list)
+            sites = ['Sites']
+
+        # SolarEdge actuals
+        start_time = date.strftime('%Y-%m-%d 00:00:00') # date arguments for SolarEdge API
+        end_time = date.strftime('%Y-%m-%d 23:59:59')
+        day = date.strftime('%Y-%m-%d')
+
+        if time_view in ('past', 'today'):
+            # Power history (from local store, only missing data is requested)
+            planner.add('Power', lambda: self.store.get_site_power(self.sec, 0, start_time, end_time), depends_on=sites)
+
+        if time_view == 'today':
+            # Current values
+            planner.add('Overview', lambda: self.sec.get_site_overview(0), depends_on=sites)
+
+        if time_view == 'past':
+            # Total production
+            planner.add('Energy', lambda: self.store.get_site_energy(self.sec, 0, day, day), depends_on=sites)
+
+        # Do requests
+        results = planner.run()
+        self.sites_loaded = True
+
+        result['local_capacity'] = self.sec.sites[0]['peakPower'] # [kWp]
+        result['sun_times'] = results['Sun']
+
+        if elia_data == None:
+            elia_data = results['Elia']
+
+        #------------------------------ Forecast ------------------------------#
+
+        # Recalculate to local capacity
+        local_forecast = LocalForecast(elia_data, result['local_capacity'], verbose=self.verbose, info=self.info)
+        result['forecast'] = local_forecast
+
+        # Progress print
+        if self.verbose:
+            print('Calculating predictions... ', end='')
+
+        # Total production
+        result['predicted_total_kwh'] = local_forecast.total_kwh
+
+        # Current power and production
+        if time_view == 'today':
+            datetime_now = datetime.datetime.now(tz=self.local_tz)
+            result['predicted_current_power'] = local_forecast.power_at(datetime_now)
+            result['predicted_current_kwh'] = local_forecast.energy_at(datetime_now)
+
+        # Print info
+        if self.info:
+            print('\n' + BLUE + 'Predictions')
+            print('Total daily production: %.2f kWh' % result['predicted_total_kwh'])
+            if time_view == 'today':
+                print('Current power: %.2f kW' % result['predicted_current_power'])
+                print('Current production: %.2f kWh' % result['predicted_current_kwh'])
+
+        # Progress print
+        if self.verbose:
+            print(GREEN + 'Done')
+
+        #------------------------------ Actuals -------------------------------#
+
+        if time_view in ('past', 'today'):
+            result['actual'] = results['Power']
+
+        if time_view == 'today':
+            last_update, current_power, current_production = results['Overview']
+            result['actual_current_power'] = current_power/1000 # W to kW
+            result['actual_current_kwh'] = current_production/1000 # Wh to kWh
+            result['actual_last_updated'] = last_update
+
+        if time_view == 'past':
+            result['actual_total_kwh'] = results['Energy']['value'][0]
+
+        return result
+
+
+    def plot(self, result, plot):
+        '''
+        Plot result of run()
+
+        Arguments
+        ---------
+        result  (dict)      : see run()
+        plot    (SolarPlot)
+
+        Returns
+        -------
+        figure  (matplotlib.Figure)
+        '''
+        forecast = {}
+        forecast['time'] = result['forecast'].time
+        forecast['value'] = result['forecast'].power
+
+        # Arguments that are not available for every time view are left out
+        optional = ['predicted_current_power', 'predicted_current_kwh',
+                    'actual', 'actual_current_power', 'actual_current_kwh', 'actual_last_updated', 'actual_total_kwh']
+        kwargs = {key: result[key] for key in optional if key in result}
+
+        return plot.solar_power(result['time_view'], self.local_tz, dict(result['sun_times']), result['local_capacity'],
+                                forecast, result['predicted_total_kwh'], **kwargs)
+
+
+    def summary(self, result):
+        '''
+        Arguments
+        ---------
+        result  (dict)  : see run()
+
+        Returns
+        -------
+        summary (dict)  : numbers of result (JSON serializable)
+        '''
+        summary = {}
+        summary['date'] = result['date'].strftime('%Y-%m-%d')
+        summary['time_view'] = result['time_view']
+        summary['local_capacity'] = result['local_capacity']
+        summary['sun_times'] = {key: value.isoformat() for key, value in result['sun_times'].items()}
+
+        for key in ['predicted_total_kwh', 'predicted_current_power', 'predicted_current_kwh',
+                    'actual_current_power', 'actual_current_kwh', 'actual_total_kwh']:
+            if key in result:
+                summary[key] = float(result[key])
+
+        if 'actual_last_updated' in result:
+            summary['actual_last_updated'] = result['actual_last_updated'].isoformat()
+
+        return summary
@@ -0,0 +1,166 @@
+#! python3
+
+import numpy as np
+
+from color import RED, GREEN, BLUE
+
+
+class LocalForecast:
+    '''
+    Elia forecast recalculated to local capacity
+
+    All calculations are done on NumPy arrays. The cumulative energy at each
+    forecast timestamp is calculated once (trapezoidal rule = exact integral
+    of the linearly interpolated power). The energy in any time window is then
+    calculated in closed form from these prefix sums, instead of numerically
+    integrating the interpolated power.
+
+    Missing values (empty in the Elia response, NaN) are linearly interpolated
+    between their neighbours (the nearest value at the start and end).
+    '''
+    def __init__(self, data, local_capacity, verbose=True, info=False, debug=False):
+        '''
+        Arguments
+        ---------
+        data            (dict)  : see EliaConnector.get_chart_data
+        local_capacity  (float) : [kWp]
+        '''
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        # Progress print
+        if self.verbose:
+            print('Scaling prediction data... ', end='')
+
+        # Time elapsed since start, in seconds
+        self.time = data['time']
+        self.elapsed_s = np.asarray((self.time - self.time[0]).total_seconds(), dtype=float)
+
+        # Recalculate to local capacity
+        self.load_factor = np.asarray(data['MostRecentForecast']) / np.asarray(data['MonitoredCapacity']) * 100 # [%]
+
+        # Fill in missing values (NaN would spread through the cumulative energy)
+        valid = np.isfinite(self.load_factor)
+        if not valid.any():
+            raise Exception(RED + 'No forecast values')
+        self.missing = np.count_nonzero(~valid)
+        if self.missing > 0:
+            self.load_factor = np.interp(self.elapsed_s, self.elapsed_s[valid], self.load_factor[valid])
+
+        self.power = self.load_factor/100 * local_capacity # [kW]
+
+        # Cumulative energy (kW to kJ), one trapezoidal integration pass
+        self.energy_kj = np.zeros(len(self.power))
+        np.cumsum(np.diff(self.elapsed_s) * (self.power[1:] + self.power[:-1]) / 2, out=self.energy_kj[1:])
+
+        # Print info
+        if self.info:
+            import pandas as pd
+            df = pd.DataFrame({'PredictedLoadFactor': self.load_factor, 'LocalForecast': self.power}, index=self.time)
+            print('\n' + BLUE + 'Prediction Data')
+            print(df.to_string())
+            print('Missing values (interpolated): %d' % self.missing)
+
+        # Progress print
+        if self.verbose:
+            print(GREEN + 'Done')
+
+
+    @property
+    def total_kwh(self):
+        '''
+        Predicted production over the whole forecast [kWh]
+        '''
+        return self.energy_kj[-1] / 3600
+
+
+    def power_at(self, t):
+        '''
+        Arguments
+        ---------
+        t   (datetime)  : timezone aware
+
+        Returns
+        -------
+        power   (float) : predicted power (linear interpolation) [kW]
+        '''
+        return np.interp(self._seconds(t), self.elapsed_s, self.power)
+
+
+    def energy_at(self, t):
+        '''
+        Arguments
+        ---------
+        t   (datetime)  : timezone aware
+
+        Returns
+        -------
+        energy  (float) : predicted production from start of forecast up to t [kWh]
+        '''
+        return self._energy_kj(self._seconds(t))[()] / 3600
+
+
+    def energy_between(self, t0, t1):
+        '''
+        Predicted production in time window(s) [t0, t1]
+
+        Exact for the linearly interpolated power curve, windows are clipped to
+        the forecast range.
+
+        Arguments
+        ---------
+        t0  (datetime or pandas.DatetimeIndex)  : start of window(s), timezone aware
+        t1  (datetime or pandas.DatetimeIndex)  : end of window(s), timezone aware
+
+        Returns
+        -------
+        energy  (float or numpy.ndarray)    : [kWh]
+        '''
+        return (self._energy_kj(self._seconds(t1)) - self._energy_kj(self._seconds(t0)))[()] / 3600
+
+
+    def quarter_hours(self, date, tz):
+        '''
+        Average predicted power per quarter-hour of a day (local clock time)
+
+        Arguments
+        ---------
+        date    (date)
+        tz      (string)    : local timezone (pytz format)
+
+        Returns
+        -------
+        power   (numpy.ndarray) : 96 values, index = hour*4 + quarter [kW]
+        '''
+        import pandas as pd
+        from timeutil import localize_naive
+
+        start = localize_naive(pd.date_range(date, periods=96, freq='15min'), tz)
+        return self.energy_between(start, start + pd.Timedelta(minutes=15)) * 4 # kWh per quarter-hour to kW
+
+
+    def _energy_kj(self, s):
+        '''
+        Arguments
+        ---------
+        s   (numpy.ndarray) : seconds since start of forecast
+
+        Returns
+        -------
+        energy  (numpy.ndarray) : production from start of forecast up to s [kJ]
+        '''
+        s = np.clip(s, self.elapsed_s[0], self.elapsed_s[-1])
+
+        # Interval containing s (prefix sum up to its start)
+        i = np.clip(np.searchsorted(self.elapsed_s, s, side='right') - 1, 0, len(self.elapsed_s) - 2)
+
+        # Add trapezoid from start of interval up to s
+        power_s = np.interp(s, self.elapsed_s, self.power)
+        return self.energy_kj[i] + (s - self.elapsed_s[i]) * (self.power[i] + power_s) / 2
+
+
+    def _seconds(self, t):
+        # Seconds since start of forecast
+        return np.asarray((t - self.time[0]).total_seconds(), dtype=float)
@@ -0,0 +1,58 @@
+#! python3
+
+# Live solar power chart of today, updated in place
+#   py live.py [INTERVAL]
+# INTERVAL is the shortest refresh interval in seconds (default 120). Every refresh requests the
+# current values from the SolarEdge API (about 2 requests), so the refresh interval adapts to the
+# daily request budget: slow at night, faster when the power changes quickly (see AdaptiveInterval).
+
+import sys
+import time
+import datetime
+
+from color import RED
+from engine import SolarEngine
+from plot import LiveSolarPlot
+from adaptive import AdaptiveInterval
+
+local_timezone = 'Europe/Brussels' # pytz format
+
+############################## Process Arguments ###############################
+
+try:
+    min_interval = float(sys.argv[1]) if len(sys.argv) > 1 else 120
+except ValueError:
+    print(RED + 'Syntax: live.py [INTERVAL]')
+    sys.exit()
+
+##################################### Loop #####################################
+
+engine = SolarEngine(tz=local_timezone, verbose=False)
+plot = LiveSolarPlot()
+
+# Site overview and power sync per refresh
+refresh_interval = AdaptiveInterval(engine.sec.budget, engine.st, tz=local_timezone, lat=engine.lat, lon=engine.lon,
+                                    min_interval=min_interval, max_interval=max(min_interval, 600), requests_per_poll=2,
+                                    verbose=False)
+
+try:
+    while True:
+        try:
+            result = engine.run(datetime.date.today())
+            engine.plot(result, plot)
+            refresh_interval.update({'solar': result['actual_current_power']})
+        except Exception as ex:
+            print(ex)
+
+        try:
+            interval = refresh_interval()
+        except Exception as ex:
+            print(ex)
+            interval = refresh_interval.interval or 600
+
+        if plot.figure != None:
+            plot.wait(interval) # keeps window responsive
+        else:
+            time.sleep(interval)
+except KeyboardInterrupt:
+    print('Stopped')
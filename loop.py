@@ -1,57 +1,127 @@
 #! python3
 
 import sys
-import time
-from datetime import datetime
+import hashlib
+import datetime
 
-from color import BLUE, RED, GREEN, YELLOW, YELLOW_BRIGHT
+import pytz
+
+from color import RED, GREEN, YELLOW
 from solaredge import SolarEdgeConnector
+from elia import EliaConnector
+from solar import SolarTimes
 from plc import PLCConnector
+from adaptive import AdaptiveInterval
+from poller import PollingEngine, print_time_prefix
 
-
-def print_time_prefix():
-    now = datetime.now()
-    print('[' + now.strftime('%H:%M:%S') + ']', end=' ')
+# Site
+local_timezone = 'Europe/Brussels' # pytz format
+region = 5 # Elia region number
+lat = 51.197567558420694
+lon = 4.716483482278131
 
 
 # Create connectors
-sec = SolarEdgeConnector(verbose=False)
+sec = SolarEdgeConnector(tz=local_timezone, verbose=False)
 try:
     sec.get_sites_list()
 except Exception as ex:
     print(ex)
     sys.exit()
+ec = EliaConnector(verbose=False)
+st = SolarTimes(verbose=False)
 print_time_prefix()
 plc = PLCConnector(verbose=False)
 
-# Infinite loop, stopped by KeyBoardInterrupt
-try:
-    while True:
-        try:
-            # Get power flow data
-            print_time_prefix()
-            print('Getting power flow data... ', end='')
-            component_power, component_status, connections, battery_level = sec.get_site_power_flow(0)
-            print(GREEN + 'Done')
-        except Exception as ex:
-            print(ex)
-        else:
-            try:
-                # Write data to PLC
-                print_time_prefix()
-                print('Writing data to PLC... ', end='')
-                plc.write_int_to_db(db=99, offset=404, value=battery_level)
-                plc.write_real_to_db(db=99, offset=420, value=component_power['grid'])
-                plc.write_real_to_db(db=99, offset=424, value=component_power['house'])
-                plc.write_real_to_db(db=99, offset=428, value=component_power['solar'])
-                plc.write_real_to_db(db=99, offset=432, value=component_power['battery'])
-                print(GREEN + 'Done')
-            except Exception as ex:
-                print(ex)
-
-        # Wait for next iteration
-        print('Waiting...', end='')
-        time.sleep(30)
-        print('\r', end='')
-except KeyboardInterrupt:
-    print('\n' + 'Stopped')
+# SolarEdge polling interval: slow at night, fast when the power flow changes quickly, within the daily budget
+power_flow_interval = AdaptiveInterval(sec.budget, st, tz=local_timezone, lat=lat, lon=lon, verbose=False, info=True)
+
+# Minimum change of power flow values to write to the PLC [kW]
+power_flow_deadband = {'PowerFlow.Grid': 0.05, 'PowerFlow.House': 0.05, 'PowerFlow.Solar': 0.05, 'PowerFlow.Battery': 0.05}
+
+# Latest data, shared between jobs
+latest = {'power_flow': None, 'version': 0, 'written': 0}
+
+# Elia forecast that was last written to the PLC
+forecast_written = {'hash': None}
+
+
+def fetch_power_flow():
+    # Get power flow data
+    component_power, component_status, connections, battery_level = sec.get_site_power_flow(0)
+    latest['power_flow'] = (component_power, battery_level)
+    latest['version'] += 1
+    power_flow_interval.update(component_power)
+
+    print_time_prefix()
+    print('Power flow data received')
+
+
+def write_plc():
+    # Only write new data
+    if latest['version'] == latest['written']:
+        return
+    version = latest['version']
+    component_power, battery_level = latest['power_flow']
+
+    # Write changed data to PLC
+    size = plc.write_power_flow(battery_level, component_power, deadband=power_flow_deadband)
+    latest['written'] = version
+
+    print_time_prefix()
+    if not plc.connected:
+        print(YELLOW + 'PLC offline, data queued')
+    elif size > 0:
+        print('Data written to PLC (%d bytes)' % size)
+    else:
+        print('No changes to write to PLC')
+
+
+def write_forecast():
+    # Forecast of today (Elia responses are cached, see EliaConnector)
+    today = datetime.datetime.now(tz=pytz.timezone(local_timezone)).date()
+    date_from = today.strftime('%Y-%m-%d')
+    date_to = (today + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    data = ec.get_chart_data(date_from, date_to, region=region, tz=local_timezone)
+
+    # Only write a new forecast (new day or new publication by Elia)
+    hash = hashlib.sha1(date_from.encode() + data['MostRecentForecast'].tobytes() + data['MonitoredCapacity'].tobytes()).hexdigest()
+    if hash == forecast_written['hash']:
+        return
+
+    # Recalculate to local capacity, per quarter-hour (numpy is only imported when a forecast is written)
+    from forecast import LocalForecast
+    local_forecast = LocalForecast(data, sec.sites[0]['peakPower'], verbose=False)
+    sun_times = st.get_times(tz=local_timezone, lat=lat, lon=lon, date=today)
+
+    # Write changed data to PLC
+    size = plc.write_forecast(local_forecast.quarter_hours(today, local_timezone), sun_times)
+    forecast_written['hash'] = hash
+
+    print_time_prefix()
+    if not plc.connected:
+        print(YELLOW + 'PLC offline, forecast queued')
+    else:
+        print('Forecast written to PLC (%d bytes)' % size)
+
+
+def check_plc():
+    # Detect lost connection, reconnect (with backoff) and write queued data
+    was_connected = plc.connected
+    plc.check()
+
+    if plc.connected != was_connected:
+        print_time_prefix()
+        print(GREEN + 'PLC reconnected' if plc.connected else RED + 'PLC connection lost')
+
+
+# Poll SolarEdge (adaptive interval), write new data to PLC as soon as it is available
+# (independent jobs: a slow API request does not delay PLC writes), check for a new Elia forecast
+# every 5 minutes, check the PLC connection every 10 seconds, stopped by KeyboardInterrupt
+engine = PollingEngine(info=True)
+engine.add_job('SolarEdge', fetch_power_flow, interval=power_flow_interval)
+engine.add_job('PLC', write_plc, interval=1)
+engine.add_job('Forecast', write_forecast, interval=5*60)
+engine.add_job('PLC check', check_plc, interval=10)
+engine.run()
+plc.print_statistics()
@@ -0,0 +1,96 @@
+#! python3
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from color import BLUE, RED, GREEN
+
+
+class FetchPlanner:
+    '''
+    Run independent data requests concurrently
+
+    Each request is a function without arguments. A request only starts when
+    the requests it depends on are finished, all others run at the same time.
+    '''
+    def __init__(self, max_workers=6, verbose=True, info=False, debug=False):
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        self.max_workers = max_workers
+        self.requests = {} # {name : (function, depends_on)}
+
+        # Results
+        self.results = {} # {name : return value}
+        self.latency = {} # {name : duration [s]}
+
+
+    def add(self, name, function, depends_on=()):
+        '''
+        Arguments
+        ---------
+        name        (string)
+        function    (callable)  : function without arguments
+        depends_on  (tuple)     : names of requests that need to finish first
+        '''
+        for dependency in depends_on:
+            if dependency not in self.requests:
+                raise Exception(RED + 'Unknown dependency: %s' % dependency)
+
+        self.requests[name] = (function, tuple(depends_on))
+
+
+    def run(self):
+        '''
+        Run all requests
+
+        Returns
+        -------
+        results (dict)  : {name : return value}
+        '''
+        # Progress print
+        if self.verbose:
+            print('Getting data (%d requests)... ' % len(self.requests), end='')
+
+        start = time.perf_counter()
+        todo = dict(self.requests)
+        running = {} # {future : name}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(todo) > 0 or len(running) > 0:
+                # Start all requests whose dependencies are finished
+                for name, (function, depends_on) in list(todo.items()):
+                    if all(dependency in self.results for dependency in depends_on):
+                        running[executor.submit(self._timed, name, function)] = name
+                        del todo[name]
+
+                # Wait for a request to finish
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    name, result = future.result() # raises exception of request
+                    self.results[name] = result
+
+        total = time.perf_counter() - start
+
+        # Progress print
+        if self.verbose:
+            print(GREEN + 'Done')
+
+        # Print info
+        if self.info:
+            print('\n' + BLUE + 'Request Latency')
+            for name, duration in sorted(self.latency.items(), key=lambda item: item[1], reverse=True):
+                print('%s %.2f s' % (name.ljust(12), duration))
+            print('%s %.2f s' % ('Total'.ljust(12), total))
+
+        return self.results
+
+
+    def _timed(self, name, function):
+        start = time.perf_counter()
+        result = function()
+        self.latency[name] = time.perf_counter() - start
+        return name, result
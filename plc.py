@@ -1,18 +1,39 @@
 #! python3
 
 import json
+import time
+import struct
+import threading
 
 from snap7.client import Client
 import snap7.util
 
 from color import BLUE, RED, GREEN, YELLOW, YELLOW_BRIGHT
+from plc_codec import ShadowCopy, compile_layout
+from plc_db_layouts import db99_layout, power_flow_layout, forecast_layout
+
+
+def _ms_since_midnight(dt):
+    # PLC TIME of day (local clock time)
+    return ((dt.hour*60 + dt.minute)*60 + dt.second)*1000 + dt.microsecond//1000
 
 
 class PLCConnector:
     '''
     Connect and communicate with PLC
+
+    The connection is managed: a lost connection is detected on failed
+    requests (or by check), reconnect attempts are spaced with exponential
+    backoff. While offline, the latest values per DB area are queued and
+    written as soon as the connection is back.
     '''
-    def __init__(self, verbose=True, info=False, debug=False):
+    def __init__(self, verbose=True, info=False, debug=False, backoff=1.0, max_backoff=60):
+        '''
+        Arguments
+        ---------
+        backoff     (float) : delay before the second reconnect attempt [s], doubles after every failed attempt
+        max_backoff (float) : maximum delay between reconnect attempts [s]
+        '''
         # Verbosity
         self.verbose = verbose
         self.info = info
@@ -23,14 +44,40 @@ class PLCConnector:
             self.credentials = json.load(file)
 
         # PLC IP address from credentials
-        ip = self.credentials['plc']['ip']['local']
+        self.ip = self.credentials['plc']['ip']['local']
+
+        # Last written contents per DB and layout (see write_changes)
+        self.shadows = {}
+
+        # Latest values per DB and layout that still need to be written
+        self.queue = {} # {(db, layout) : values}
+
+        # Client is shared between threads (e.g. jobs of loop.py)
+        self.lock = threading.Lock()
+
+        # Connection
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.failed_attempts = 0
+        self.next_attempt = 0 # time.monotonic() of next reconnect attempt
+
+        # Statistics
+        self.started = time.monotonic()
+        self.connected_since = None
+        self.connected_time = 0 # of previous connections [s]
+        self.connects = 0
+        self.writes = 0
+        self.total_write_latency = 0
+        self.max_write_latency = 0
 
         # Create client
         print('Connecting to PLC... ', end='')
         self.client = Client()
-        self.client.connect(ip, 0, 2, 102)
-        if self.client.get_connected():
+        if self._connect():
             print(GREEN + 'Connected')
+        else:
+            print(YELLOW + 'Offline, retrying in the background')
 
 
     def list_blocks(self):
@@ -41,14 +88,211 @@ class PLCConnector:
         print(GREEN + 'Done')
 
 
-    def read_db(self):
-        print('Read from DB99... ')
-        data = self.client.db_read(99, 5, 1)
-        float = snap7.util.get_byte(data,0)
-        print(float)
+    def read_db(self, db=99, layout=db99_layout):
+        print('Read from DB%i... ' % db)
+        values = self.read_layout(layout, db=db)
+        for name, value in values.items():
+            print('%s: %s' % (name, value))
         print(GREEN + 'Done')
 
 
+    def read_layout(self, layout, db=99, names=None):
+        '''
+        Read and decode fields of a layout from PLC DB
+
+        All fields are read with one read of the whole area (split by snap7
+        only if it does not fit in one PDU). A subset of fields is read with
+        multi-variable requests (see read_ranges).
+
+        Arguments
+        ---------
+        layout  (string)    : see plc_db_layouts
+        db      (int)       : db number
+        names   (list)      : fields to read (default all)
+
+        Returns
+        -------
+        values  (dict)  : {name : value}
+        '''
+        compiled = compile_layout(layout)
+
+        if names == None:
+            data = self._read(lambda: self.client.db_read(db, compiled.start, compiled.size))
+            return compiled.unpack_from(data, db_offset=compiled.start)
+
+        data = self.read_ranges([(compiled.offsets[name], compiled.sizes[name]) for name in names], db=db)
+        return {name: compiled.unpack_field(name, buffer, db_offset=compiled.offsets[name]) for name, buffer in zip(names, data)}
+
+
+    def read_layout_array(self, layout, db=99):
+        '''
+        Read all fields of a layout from PLC DB (one read), as NumPy structured array
+
+        Arguments
+        ---------
+        layout  (string)    : see plc_db_layouts
+        db      (int)       : db number
+
+        Returns
+        -------
+        values  (numpy.ndarray) : one record, field names of the layout (see CompiledLayout.dtype)
+        '''
+        compiled = compile_layout(layout)
+        data = self._read(lambda: self.client.db_read(db, compiled.start, compiled.size))
+        return compiled.unpack_array(data, db_offset=compiled.start)
+
+
+    def read_ranges(self, ranges, db=99):
+        '''
+        Read byte ranges from PLC DB, as many ranges per request as possible
+
+        Ranges are combined in multi-variable reads (maximum 20 per request,
+        the response has to fit in one PDU). A range that does not fit in a
+        PDU together with others is read on its own.
+
+        Arguments
+        ---------
+        ranges  (list)  : [(offset, size)]
+        db      (int)   : db number
+
+        Returns
+        -------
+        data    (list)  : bytearray per range
+        '''
+        return self._read(lambda: self._read_multi_vars(ranges, db))
+
+
+    def _read_multi_vars(self, ranges, db):
+        import ctypes
+        from snap7.types import S7DataItem, S7AreaDB, S7WLByte
+
+        # Split in requests (response per item: 4 bytes header + data, padded to even size)
+        budget = self.client.get_pdu_length() - 18 # minus response headers
+        batches = []
+        used = 0
+        for i, (offset, size) in enumerate(ranges):
+            cost = 4 + size + size % 2
+            if len(batches) == 0 or len(batches[-1]) == 20 or used + cost > budget:
+                batches.append([])
+                used = 0
+            batches[-1].append(i)
+            used += cost
+
+        data = [None] * len(ranges)
+        for batch in batches:
+            # One range: normal read
+            if len(batch) == 1:
+                offset, size = ranges[batch[0]]
+                data[batch[0]] = self.client.db_read(db, offset, size)
+                continue
+
+            items = (S7DataItem * len(batch))()
+            buffers = []
+            for item, i in zip(items, batch):
+                offset, size = ranges[i]
+                buffers.append(ctypes.create_string_buffer(size))
+                item.Area = S7AreaDB
+                item.WordLen = S7WLByte
+                item.Result = 0
+                item.DBNumber = db
+                item.Start = offset
+                item.Amount = size
+                item.pData = ctypes.cast(ctypes.pointer(buffers[-1]), ctypes.POINTER(ctypes.c_uint8))
+
+            self.client.read_multi_vars(items)
+
+            for item, i, buffer in zip(items, batch, buffers):
+                if item.Result != 0:
+                    raise snap7.exceptions.Snap7Exception('Read of DB%i.DBB%i failed (%i)' % (db, item.Start, item.Result))
+                data[i] = bytearray(buffer.raw)
+
+        return data
+
+
+    def _write_multi_vars(self, ranges, db):
+        '''
+        Write byte ranges to PLC DB, as many ranges per request as possible
+        (same limits as _read_multi_vars, one range is written with a normal write)
+
+        Arguments
+        ---------
+        ranges  (list)  : [(offset, data (bytearray))]
+        db      (int)   : db number
+
+        Returns
+        -------
+        requests    (int)   : number of requests
+        '''
+        import ctypes
+        from snap7.types import S7DataItem, S7AreaDB, S7WLByte
+
+        # Split in requests (request per item: 12 bytes address + 4 bytes header + data, padded to even size)
+        budget = self.client.get_pdu_length() - 12 # minus request headers
+        batches = []
+        used = 0
+        for offset, data in ranges:
+            cost = 16 + len(data) + len(data) % 2
+            if len(batches) == 0 or len(batches[-1]) == 20 or used + cost > budget:
+                batches.append([])
+                used = 0
+            batches[-1].append((offset, data))
+            used += cost
+
+        for batch in batches:
+            # One range: normal write
+            if len(batch) == 1:
+                offset, data = batch[0]
+                self.client.write_area(snap7.types.Areas.DB, db, offset, data)
+                continue
+
+            items = (S7DataItem * len(batch))()
+            buffers = []
+            for item, (offset, data) in zip(items, batch):
+                buffers.append(ctypes.create_string_buffer(bytes(data), len(data)))
+                item.Area = S7AreaDB
+                item.WordLen = S7WLByte
+                item.Result = 0
+                item.DBNumber = db
+                item.Start = offset
+                item.Amount = len(data)
+                item.pData = ctypes.cast(ctypes.pointer(buffers[-1]), ctypes.POINTER(ctypes.c_uint8))
+
+            self.client.write_multi_vars(items)
+
+            for item in items:
+                if item.Result != 0:
+                    raise snap7.exceptions.Snap7Exception('Write of DB%i.DBB%i failed (%i)' % (db, item.Start, item.Result))
+
+        return len(batches)
+
+
+    def _read(self, function):
+        '''
+        Do read request (reconnect first if needed)
+
+        Arguments
+        ---------
+        function    (callable)  : function without arguments, using self.client
+
+        Returns
+        -------
+        result of function
+        '''
+        with self.lock:
+            if not self.connected:
+                self._write_queue() # reconnects (with backoff) and writes queued values
+                if not self.connected:
+                    raise Exception(RED + 'PLC offline')
+
+            try:
+                return function()
+            except snap7.exceptions.Snap7Exception as ex:
+                #print(ex)
+                if not self.client.get_connected():
+                    self._disconnect()
+                raise Exception(RED + 'Read from PLC Failed')
+
+
     def write_int_to_db(self, db, offset, value):
         '''
         Write INT to PLC DB
@@ -109,6 +353,242 @@ class PLCConnector:
             print(GREEN + 'Done')
 
 
+    def write_power_flow(self, battery_level, component_power, db=99, deadband=None):
+        '''
+        Write battery level and power flow to PLC DB (only what changed)
+
+        See plc_db_layouts.power_flow_layout and write_changes. The battery
+        level (404-407) and the power flow (420-435) are separate ranges,
+        written in one request. The bytes in between (BYD.SOH, BYD.Capacity)
+        belong to the PLC and are never written.
+
+        Arguments
+        ---------
+        battery_level   (float) :  [%]
+        component_power (dict)  :  {name (string) : power (float) [kW]}, see SolarEdgeConnector.get_site_power_flow
+        db              (int)   :  db number
+        deadband        (dict)  :  {name : minimum change to write}, see write_changes
+
+        Returns
+        -------
+        size    (int)   : number of bytes written
+        '''
+        # Prepare data
+        values = {}
+        values['BYD.SOC'] = battery_level
+        values['PowerFlow.Grid'] = component_power['grid']
+        values['PowerFlow.House'] = component_power['house']
+        values['PowerFlow.Solar'] = component_power['solar']
+        values['PowerFlow.Battery'] = component_power['battery']
+
+        return self.write_changes(power_flow_layout, values, db=db, deadband=deadband)
+
+
+    def write_changes(self, layout, values, db=99, deadband=None):
+        '''
+        Write only the changed bytes of a layout to PLC DB
+
+        A shadow copy of the last written bytes is kept per DB and layout. The
+        new values are compared with it and only dirty byte ranges are written
+        (see plc_codec.ShadowCopy) in one request, nothing is written if
+        nothing changed.
+        While offline, the values are queued (see PLCConnector). Values that
+        cannot be encoded (missing, None, NaN for an integer) raise an
+        exception and are not queued.
+
+        Arguments
+        ---------
+        layout      (string)    : see plc_db_layouts
+        values      (dict)      : {name : value}, all fields of the layout
+        db          (int)       : db number
+        deadband    (dict)      : {name : minimum change to write}, smaller changes are not written
+
+        Returns
+        -------
+        size    (int)   : number of bytes written (0 if offline)
+        '''
+        with self.lock:
+            # Shadows are iterated on reconnect (other thread), only change them while locked
+            if (db, layout) not in self.shadows:
+                self.shadows[(db, layout)] = ShadowCopy(layout)
+            if deadband != None:
+                self.shadows[(db, layout)].deadband = deadband
+
+            # Check values before queueing (a value that cannot be encoded would block the queue)
+            try:
+                self.shadows[(db, layout)].layout.pack(values)
+            except (KeyError, TypeError, ValueError, OverflowError, struct.error) as ex:
+                raise Exception(RED + 'Invalid values for DB%i, not written: %s' % (db, ex))
+
+            self.queue[(db, layout)] = values
+            return self._write_queue()
+
+
+    def check(self):
+        '''
+        Check connection: reconnect if needed and write queued values
+
+        Returns
+        -------
+        connected   (bool)
+        '''
+        with self.lock:
+            # Small request to detect a lost connection
+            if self.connected:
+                try:
+                    self.client.get_cpu_state()
+                except snap7.exceptions.Snap7Exception:
+                    self._disconnect()
+
+            self._write_queue()
+
+            return self.connected
+
+
+    def print_statistics(self):
+        now = time.monotonic()
+        connected_time = self.connected_time + (now - self.connected_since if self.connected else 0)
+        mean_latency = self.total_write_latency / self.writes if self.writes > 0 else 0
+
+        print('\n' + BLUE + 'PLC Statistics')
+        print('Connected: %s, uptime: %.1f %% of %.0f s, connects: %d'
+              % (self.connected, 100 * connected_time / (now - self.started), now - self.started, self.connects))
+        print('Writes: %d, latency: %.1f ms mean / %.1f ms max, queued: %d'
+              % (self.writes, mean_latency*1000, self.max_write_latency*1000, len(self.queue)))
+
+
+    def _write_queue(self):
+        '''
+        Write queued values (only changed bytes), reconnect first if needed
+
+        Returns
+        -------
+        size    (int)   : number of bytes written (0 if offline)
+        '''
+        if not self.connected:
+            if time.monotonic() < self.next_attempt or not self._connect():
+                return 0
+
+        size = 0
+        for (db, layout), values in list(self.queue.items()):
+            shadow = self.shadows[(db, layout)]
+            try:
+                ranges = shadow.diff(values)
+            except (KeyError, TypeError, ValueError, OverflowError, struct.error) as ex:
+                # Drop, so the other queued values are still written
+                del self.queue[(db, layout)]
+                print(RED + 'Invalid values for DB%i dropped: %s' % (db, ex))
+                continue
+
+            # Progress print
+            if self.verbose:
+                print('Write %d changed range(s) to DB%i... ' % (len(ranges), db), end='')
+
+            # Write data to PLC
+            try:
+                if len(ranges) > 0:
+                    start = time.monotonic()
+                    requests = self._write_multi_vars(ranges, db)
+                    latency = time.monotonic() - start
+
+                    self.writes += requests
+                    self.total_write_latency += latency
+                    self.max_write_latency = max(self.max_write_latency, latency)
+            except snap7.exceptions.Snap7Exception as ex:
+                #print(ex)
+                if not self.client.get_connected():
+                    # Values stay queued
+                    self._disconnect()
+                    raise Exception(RED + 'PLC connection lost')
+                del self.queue[(db, layout)]
+                raise Exception(RED + 'Write to PLC Failed')
+
+            # Only after a successful write (otherwise everything is written again next time)
+            shadow.commit()
+            del self.queue[(db, layout)]
+            size += sum(len(data) for _, data in ranges)
+
+            # Progress print
+            if self.verbose:
+                print(GREEN + 'Done')
+
+        return size
+
+
+    def _connect(self):
+        '''
+        Returns
+        -------
+        connected   (bool)
+        '''
+        try:
+            self.client.connect(self.ip, 0, 2, 102)
+        except snap7.exceptions.Snap7Exception:
+            pass
+
+        if not self.client.get_connected():
+            # Next attempt after exponential backoff
+            delay = min(self.max_backoff, self.backoff * 2**self.failed_attempts)
+            self.failed_attempts += 1
+            self.next_attempt = time.monotonic() + delay
+            return False
+
+        self.connected = True
+        self.connected_since = time.monotonic()
+        self.connects += 1
+        self.failed_attempts = 0
+
+        # PLC may have restarted, write last values of all areas again
+        for key, shadow in self.shadows.items():
+            if key not in self.queue and shadow.values != None:
+                self.queue[key] = shadow.values
+            shadow.reset()
+
+        return True
+
+
+    def _disconnect(self):
+        self.connected = False
+        self.connected_time += time.monotonic() - self.connected_since
+        self.next_attempt = time.monotonic() # first reconnect attempt right away
+
+        try:
+            self.client.disconnect()
+        except snap7.exceptions.Snap7Exception:
+            pass
+
+
+    def write_forecast(self, power, sun_times, db=99):
+        '''
+        Write quarter-hour forecast and sun times to PLC DB (only what changed)
+
+        Offsets 0-399 (plc_db_layouts.forecast_layout): Voorspelling_uur[hour].Kwartier[quarter]
+        and Ochtend (dawn), Sunrise, Sunset, Nacht (dusk) in milliseconds since midnight.
+        The area has no gaps, so the first write is one transfer.
+
+        Arguments
+        ---------
+        power       (list)  : 96 values, index = hour*4 + quarter [kW], see LocalForecast.quarter_hours
+        sun_times   (dict)  : see SolarTimes.get_times
+        db          (int)   : db number
+
+        Returns
+        -------
+        size    (int)   : number of bytes written
+        '''
+        # Prepare data
+        values = {}
+        for hour in range(24):
+            for quarter in range(4):
+                values['Voorspelling_uur[%d].Kwartier[%d]' % (hour, quarter)] = power[hour*4 + quarter]
+        values['Ochtend'] = _ms_since_midnight(sun_times['dawn'])
+        values['Sunrise'] = _ms_since_midnight(sun_times['sunrise'])
+        values['Sunset'] = _ms_since_midnight(sun_times['sunset'])
+        values['Nacht'] = _ms_since_midnight(sun_times['dusk'])
+
+        return self.write_changes(forecast_layout, values, db=db)
+
+
     def write_db_layout(self):
         # DB layout test
         from plc_db_layouts import db99_layout
@@ -147,6 +627,7 @@ if __name__ == '__main__':
     plc = PLCConnector()
     plc.list_blocks()
     #plc.read_db()
+    #plc.read_layout(power_flow_layout)
     #plc.write_db() # gone for now
 
     # Write single value:
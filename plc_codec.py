@@ -0,0 +1,279 @@
+#! python3
+
+import struct
+import functools
+
+
+# PLC data types: struct format (big endian)
+s7_formats = {
+    'BYTE':  'B',
+    'USINT': 'B',
+    'SINT':  'b',
+    'WORD':  'H',
+    'UINT':  'H',
+    'INT':   'h',
+    'DWORD': 'I',
+    'UDINT': 'I',
+    'DINT':  'i',
+    'TIME':  'i', # in milliseconds
+    'REAL':  'f',
+    'LREAL': 'd',
+}
+
+# Types that are packed as int
+s7_integer_types = {'BYTE', 'USINT', 'SINT', 'WORD', 'UINT', 'INT', 'DWORD', 'UDINT', 'DINT', 'TIME'}
+
+
+class CompiledLayout:
+    '''
+    DB layout (see plc_db_layouts) compiled to struct formats
+
+    Offsets in the layout are byte addresses in the DB. The layout is unpacked
+    with one struct call. Packing is done with one struct call per block of
+    adjacent fields (one call if the layout has no gaps), bytes in the gaps
+    are left untouched.
+    '''
+    def __init__(self, layout):
+        '''
+        Arguments
+        ---------
+        layout  (string)    : one row per field: BYTE_ADDRESS    VARIABLE_NAME     TYPE    # COMMENT
+        '''
+        # Parse layout
+        fields = []
+        for line in layout.splitlines():
+            line = line.split('#')[0].strip()
+            if line == '':
+                continue
+            offset, name, type = line.split()
+            type = type.upper()
+            if type not in s7_formats:
+                raise Exception('Unsupported type in layout: %s (%s)' % (type, name))
+            fields.append((int(offset), name, type))
+        fields.sort()
+
+        self.names = [name for _, name, _ in fields]
+        self.offsets = {name: offset for offset, name, _ in fields}
+        self.types = {name: type for _, name, type in fields}
+        self.sizes = {name: struct.calcsize('>' + s7_formats[type]) for _, name, type in fields}
+
+        # Byte range covered by the layout
+        last_offset, _, last_type = fields[-1]
+        self.start = fields[0][0]
+        self.end = last_offset + struct.calcsize('>' + s7_formats[last_type])
+        self.size = self.end - self.start
+
+        # One struct for the whole layout (gaps as pad bytes), used to unpack
+        format = '>'
+        position = self.start
+        for offset, name, type in fields:
+            if offset < position:
+                raise Exception('Overlapping field in layout: %s' % name)
+            format += '%dx' % (offset - position) if offset > position else ''
+            format += s7_formats[type]
+            position = offset + struct.calcsize('>' + s7_formats[type])
+        self.struct = struct.Struct(format)
+
+        # One struct per block of adjacent fields, used to pack
+        self.blocks = [] # [(offset, struct, names)]
+        for offset, name, type in fields:
+            if len(self.blocks) > 0 and self.blocks[-1][0] + struct.calcsize(self.blocks[-1][1]) == offset:
+                block_offset, block_format, block_names = self.blocks[-1]
+                self.blocks[-1] = (block_offset, block_format + s7_formats[type], block_names + [name])
+            else:
+                self.blocks.append((offset, '>' + s7_formats[type], [name]))
+        self.blocks = [(offset, struct.Struct(format), names) for offset, format, names in self.blocks]
+
+        self._integer = {name: type in s7_integer_types for name, type in self.types.items()}
+
+
+    def unpack_from(self, buffer, db_offset=0):
+        '''
+        Arguments
+        ---------
+        buffer      (bytearray) : DB data
+        db_offset   (int)       : DB byte address of buffer[0]
+
+        Returns
+        -------
+        values  (dict)  : {name : value}
+        '''
+        return dict(zip(self.names, self.struct.unpack_from(buffer, self.start - db_offset)))
+
+
+    def unpack_field(self, name, buffer, db_offset=0):
+        '''
+        Arguments
+        ---------
+        name        (string)
+        buffer      (bytearray) : DB data
+        db_offset   (int)       : DB byte address of buffer[0]
+
+        Returns
+        -------
+        value
+        '''
+        return struct.unpack_from('>' + s7_formats[self.types[name]], buffer, self.offsets[name] - db_offset)[0]
+
+
+    def dtype(self):
+        '''
+        Returns
+        -------
+        dtype   (numpy.dtype)   : structured, big endian, one field per name (gaps are skipped)
+        '''
+        import numpy as np
+
+        return np.dtype({'names': self.names,
+                         'formats': ['>' + s7_formats[self.types[name]] for name in self.names],
+                         'offsets': [self.offsets[name] - self.start for name in self.names],
+                         'itemsize': self.size})
+
+
+    def unpack_array(self, buffer, db_offset=0):
+        '''
+        Arguments
+        ---------
+        buffer      (bytearray) : DB data
+        db_offset   (int)       : DB byte address of buffer[0]
+
+        Returns
+        -------
+        values  (numpy.ndarray) : structured array of one record (view on buffer), see dtype
+        '''
+        import numpy as np
+
+        return np.frombuffer(buffer, dtype=self.dtype(), count=1, offset=self.start - db_offset)
+
+
+    def pack_into(self, buffer, values, db_offset=0):
+        '''
+        Arguments
+        ---------
+        buffer      (bytearray) : DB data, updated in place
+        values      (dict)      : {name : value}, all fields of the layout
+        db_offset   (int)       : DB byte address of buffer[0]
+        '''
+        for offset, block_struct, names in self.blocks:
+            block_values = [int(values[name]) if self._integer[name] else values[name] for name in names]
+            block_struct.pack_into(buffer, offset - db_offset, *block_values)
+
+
+    def pack(self, values):
+        '''
+        Arguments
+        ---------
+        values  (dict)  : {name : value}, all fields of the layout
+
+        Returns
+        -------
+        data    (bytearray) : bytes from self.start to self.end (gaps are zero)
+        '''
+        data = bytearray(self.size)
+        self.pack_into(data, values, db_offset=self.start)
+        return data
+
+
+class ShadowCopy:
+    '''
+    Last written contents of a DB area, to write only what changed
+
+    New values are packed into a copy of the last written bytes and compared
+    byte by byte. Only the dirty byte ranges are returned (ranges closer than
+    merge_gap bytes are merged, one request costs more than a few extra bytes).
+    Values that changed less than their deadband keep their last written
+    value. Bytes that do not belong to a field are never written.
+    '''
+    def __init__(self, layout, deadband=None, merge_gap=8):
+        '''
+        Arguments
+        ---------
+        layout      (string)    : see CompiledLayout
+        deadband    (dict)      : {name : minimum change to write}, other fields are written on every change
+        merge_gap   (int)       : maximum number of clean bytes between merged ranges
+        '''
+        self.layout = compile_layout(layout)
+        self.deadband = deadband or {}
+        self.merge_gap = merge_gap
+
+        # Bytes that belong to a field
+        self.mask = bytearray(self.layout.size)
+        for name in self.layout.names:
+            offset = self.layout.offsets[name] - self.layout.start
+            size = self.layout.sizes[name]
+            self.mask[offset:offset + size] = b'\x01' * size
+
+        # Last written (None = nothing written yet)
+        self.image = None
+        self.values = None
+
+        # Pending changes (see diff and commit)
+        self.pending = None
+
+
+    def diff(self, values):
+        '''
+        Arguments
+        ---------
+        values  (dict)  : {name : value}, all fields of the layout
+
+        Returns
+        -------
+        ranges  (list)  : [(db_offset, data (bytearray))], dirty byte ranges to write
+        '''
+        # Values within deadband keep their last written value
+        if self.values != None:
+            values = dict(values)
+            for name, deadband in self.deadband.items():
+                if abs(values[name] - self.values[name]) < deadband:
+                    values[name] = self.values[name]
+
+        image = bytearray(self.layout.size) if self.image == None else bytearray(self.image)
+        self.layout.pack_into(image, values, db_offset=self.layout.start)
+
+        # Dirty bytes, grouped in ranges
+        ranges = []
+        for i in range(self.layout.size):
+            if self.mask[i] and (self.image == None or image[i] != self.image[i]):
+                # Merge with previous range if only a few (known) field bytes are in between
+                if len(ranges) > 0 and i - ranges[-1][1] <= self.merge_gap and all(self.mask[ranges[-1][1]:i]):
+                    ranges[-1][1] = i + 1
+                else:
+                    ranges.append([i, i + 1])
+
+        self.pending = (image, values)
+
+        return [(self.layout.start + start, image[start:end]) for start, end in ranges]
+
+
+    def commit(self):
+        '''
+        Mark the result of the last diff as written
+        '''
+        self.image, self.values = self.pending
+        self.pending = None
+
+
+    def reset(self):
+        '''
+        Forget last written contents (everything is written on the next diff)
+        '''
+        self.image = None
+        self.values = None
+        self.pending = None
+
+
+@functools.lru_cache(maxsize=None)
+def compile_layout(layout):
+    '''
+    Compile layout, result is cached per layout
+
+    Arguments
+    ---------
+    layout  (string)    : see CompiledLayout
+
+    Returns
+    -------
+    compiled_layout (CompiledLayout)
+    '''
+    return CompiledLayout(layout)
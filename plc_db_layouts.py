@@ -1,6 +1,6 @@
 #! python3
 
-# Definition of used DB blocks
+# Definition of used DB blocks (partial layouts below are selected from these)
 
 # Syntax per row:
 #   BYTE_ADDRESS    VARIABLE_NAME     TYPE    # COMMENT
@@ -113,6 +113,14 @@ db99_layout = '''
 420	PowerFlow.Grid	REAL	# + = verbruik vanaf grid; - = teruglevering aan grid
 424	PowerFlow.House	REAL
 428	PowerFlow.Solar	REAL
+432	PowerFlow.Battery	REAL	# + = ontladen; - = laden
 440	TimeStamp	TIME	# in milliseconden vanaf middernacht
 444	Optimizers	INT
 '''
+
+# Battery level and power flow, as written by loop.py (see PLCConnector.write_power_flow)
+power_flow_names = ('BYD.SOC', 'PowerFlow.Grid', 'PowerFlow.House', 'PowerFlow.Solar', 'PowerFlow.Battery')
+power_flow_layout = '\n'.join(line for line in db99_layout.splitlines() if line != '' and line.split()[1] in power_flow_names)
+
+# Quarter-hour forecast and sun times (offsets 0-399 of DB99), see PLCConnector.write_forecast
+forecast_layout = '\n'.join(line for line in db99_layout.splitlines() if line != '' and int(line.split()[0]) < 400)
@@ -2,10 +2,7 @@
 
 import datetime
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-
-from color import GREEN, YELLOW, YELLOW_BRIGHT
+from color import RED, GREEN, YELLOW, YELLOW_BRIGHT
 
 
 def _get_text_bbox(text):
@@ -18,26 +15,98 @@ def _get_text_bbox(text):
     -------
     bbox    (matplotlib.BBox)
     '''
+    import matplotlib.pyplot as plt
+
     bbox = text.get_window_extent(renderer=plt.gcf().canvas.get_renderer()) \
                .inverse_transformed(plt.gca().transAxes) # in axes coordinates
 
     return bbox
 
 
+def _actual_line_data(actual, actual_current_power=None, actual_last_updated=None):
+    '''
+    Actual power with the last value added (only if it is later, otherwise line seems to go back)
+
+    Arguments
+    ---------
+    actual                  (dict)      : {'time': [datetime], 'value': [kW]}
+    actual_current_power    (float)     : (optional) [kW]
+    actual_last_updated     (datetime)  : (optional)
+
+    Returns
+    -------
+    time    (list)
+    value   (list)
+    '''
+    time = list(actual['time'])
+    value = list(actual['value'])
+
+    if actual_last_updated != None and actual_last_updated > time[-1]:
+        time.append(actual_last_updated)
+        value.append(actual_current_power)
+
+    return time, value
+
+
+def _y_limits(forecast_value, actual_value=None):
+    '''
+    Data range with default bottom margin and more top margin (for sun time labels)
+
+    Returns
+    -------
+    ymin    (float)
+    ymax    (float)
+    '''
+    ranges = [forecast_value]
+    if actual_value != None:
+        ranges.append(actual_value)
+
+    ymin = min(min(value) - 0.05*(max(value) - min(value)) for value in ranges) # default bottom margin
+    ymax = max(max(value) + 0.10*(max(value) - min(value)) for value in ranges) # more top margin
+
+    return ymin, ymax
+
+
 class SolarPlot:
     '''
     Plot solar predictions and actual
     '''
-    def __init__(self, verbose=True, debug=False):
+    def __init__(self, verbose=True, debug=False, backend=None):
+        '''
+        Arguments
+        ---------
+        backend (string)    : matplotlib backend, e.g. 'Agg' to render to files without a display
+        '''
         # Verbosity
         self.verbose = verbose
         self.debug = debug
 
+        # Backend (must be selected before pyplot is used)
+        if backend != None:
+            import matplotlib
+            matplotlib.use(backend)
+
 
     def show_all(self):
+        import matplotlib.pyplot as plt
         plt.show()
 
 
+    def save(self, figure, path):
+        '''
+        Save figure to file and close it (frees its memory)
+
+        Arguments
+        ---------
+        figure  (matplotlib.Figure)
+        path    (string)    : file type from extension (.png, .svg, ...)
+        '''
+        import matplotlib.pyplot as plt
+
+        figure.savefig(path)
+        plt.close(figure)
+
+
     def solar_power(self, time_view, tz, sun_times, local_capacity,
                     forecast, predicted_total_kwh,
                     predicted_current_power=None, predicted_current_kwh=None,
@@ -62,23 +131,59 @@ class SolarPlot:
         actual_last_updated     (datetime)  : (optional)
 
         actual_total_kwh
+
+        Returns
+        -------
+        figure  (matplotlib.Figure)
         '''
         # Progress print
         if self.verbose:
             print('Plotting solar power... ', end='')
             if self.debug: print()
 
+        figure, _, _ = self._solar_power_figure(time_view, tz, sun_times, local_capacity,
+                                                forecast, predicted_total_kwh,
+                                                predicted_current_power, predicted_current_kwh,
+                                                actual, actual_current_power, actual_current_kwh, actual_last_updated, actual_total_kwh)
+
+        # Progress print
+        if self.verbose:
+            print(GREEN + 'Done')
+
+        return figure
+
+
+    def _solar_power_figure(self, time_view, tz, sun_times, local_capacity,
+                            forecast, predicted_total_kwh,
+                            predicted_current_power=None, predicted_current_kwh=None,
+                            actual=None, actual_current_power=None, actual_current_kwh=None, actual_last_updated=None, actual_total_kwh=None):
+        '''
+        Build the solar power figure (arguments see solar_power)
+
+        Only the axes of the new figure are used, arguments are not modified.
+
+        Returns
+        -------
+        figure      (matplotlib.Figure)
+        artists     (dict)  : {name : artist}, artists that show data (see LiveSolarPlot)
+        table_rows  (dict)  : {argument name : row}, table rows that show values
+        '''
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+
+        artists = {}
+        table_rows = {}
+
         # Add last value (only if it is later, otherwise line seems to go back)
-        if time_view == 'today':
-            if actual_last_updated > actual['time'][-1]:
-                actual['time'].append(actual_last_updated)
-                actual['value'].append(actual_current_power)
+        if time_view in ('past', 'today'):
+            actual_time, actual_value = _actual_line_data(actual, actual_current_power, actual_last_updated)
 
         #plt.style.use('dark_background')
 
         # Create figure
         cm = 1/2.54 # inch
-        plt.figure(figsize=(35*cm,18*cm))
+        figure = plt.figure(figsize=(35*cm,18*cm))
+        ax = figure.add_subplot()
 
         # DEBUG input
         if self.debug:
@@ -88,36 +193,36 @@ class SolarPlot:
 
             if time_view in ('past', 'today'):
                 print(YELLOW + 'Actual')
-                for i, _ in enumerate(actual['time']):
-                    print(YELLOW_BRIGHT + str(actual['time'][i]) + ': %f' % (actual['value'][i]))
+                for i, _ in enumerate(actual_time):
+                    print(YELLOW_BRIGHT + str(actual_time[i]) + ': %f' % (actual_value[i]))
 
         # Plot predictions
-        lines = plt.plot(forecast['time'], forecast['value'], linewidth = 1, label='Predicted')
-        forecast_color = lines[0].get_color()
+        artists['forecast'], = ax.plot(forecast['time'], forecast['value'], linewidth = 1, label='Predicted')
+        forecast_color = artists['forecast'].get_color()
 
         # Plot actuals
         if time_view in ['past', 'today']:
-            lines = plt.plot(actual['time'], actual['value'], linewidth = 1, label='Actual')
-            actual_color = lines[0].get_color()
+            artists['actual'], = ax.plot(actual_time, actual_value, linewidth = 1, label='Actual')
+            actual_color = artists['actual'].get_color()
 
         # Plot settings
-        plt.legend(loc='lower left', bbox_to_anchor=(-0.2, 0.0))
+        ax.legend(loc='lower left', bbox_to_anchor=(-0.2, 0.0))
 
-        plt.subplots_adjust(left=0.28, right=0.92, top=0.9, bottom=0.1)
+        figure.subplots_adjust(left=0.28, right=0.92, top=0.9, bottom=0.1)
 
-        plt.suptitle('Solar Power Forecast', fontweight='bold', fontsize= 15)
-        plt.ylabel('[kW]')
+        figure.suptitle('Solar Power Forecast', fontweight='bold', fontsize= 15)
+        ax.set_ylabel('[kW]')
 
-        plt.xlim(forecast['time'][0], forecast['time'][-1])
+        ax.set_xlim(forecast['time'][0], forecast['time'][-1])
 
-        plt.grid(which='major', alpha=0.5)
-        plt.grid(which='minor', alpha=0.5)
+        ax.grid(which='major', alpha=0.5)
+        ax.grid(which='minor', alpha=0.5)
 
-        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1, tz=tz))
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d/%m/%y', tz=tz))
+        ax.xaxis.set_major_locator(mdates.DayLocator(interval=1, tz=tz))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m/%y', tz=tz))
 
-        plt.gca().xaxis.set_minor_locator(mdates.HourLocator(interval=2, tz=tz))
-        plt.gca().xaxis.set_minor_formatter(mdates.DateFormatter('%Hu', tz=tz))
+        ax.xaxis.set_minor_locator(mdates.HourLocator(interval=2, tz=tz))
+        ax.xaxis.set_minor_formatter(mdates.DateFormatter('%Hu', tz=tz))
 
         #--------------------------- Current values ---------------------------#
 
@@ -125,70 +230,57 @@ class SolarPlot:
             # Current time
             if predicted_current_power != None:
                 datetime_now = datetime.datetime.now(tz=tz)
-                plt.axvline(x=datetime_now, color='r', linestyle='dashed', linewidth=1, alpha=0.7)
+                artists['now'] = ax.axvline(x=datetime_now, color='r', linestyle='dashed', linewidth=1, alpha=0.7)
 
                 label = datetime_now.strftime('%Hu%M')
-                trans = plt.gca().get_xaxis_transform()
-                plt.text(datetime_now, 1.01, label, transform=trans,
-                         horizontalalignment = 'center',
-                         verticalalignment = 'bottom',
-                         color='r')
+                artists['now_label'] = ax.text(datetime_now, 1.01, label, transform=ax.get_xaxis_transform(),
+                                               horizontalalignment = 'center',
+                                               verticalalignment = 'bottom',
+                                               color='r')
 
             # Current predicted power
             if predicted_current_power != None:
-                plt.axhline(y=predicted_current_power, color=forecast_color, linestyle='dashed', linewidth=1, alpha=0.7)
-                plt.plot(datetime_now, predicted_current_power, 'o', color=forecast_color)
+                artists['predicted_current'] = ax.axhline(y=predicted_current_power, color=forecast_color, linestyle='dashed', linewidth=1, alpha=0.7)
+                artists['predicted_current_marker'], = ax.plot(datetime_now, predicted_current_power, 'o', color=forecast_color)
 
-                trans = plt.gca().get_yaxis_transform()
-                plt.text(1.01, predicted_current_power, '%.2f kW' % predicted_current_power, transform=trans,
-                         horizontalalignment = 'left',
-                         verticalalignment = 'center',
-                         color=forecast_color)
+                artists['predicted_current_label'] = ax.text(1.01, predicted_current_power, '%.2f kW' % predicted_current_power,
+                                                             transform=ax.get_yaxis_transform(),
+                                                             horizontalalignment = 'left',
+                                                             verticalalignment = 'center',
+                                                             color=forecast_color)
 
             # Current actual power
             if actual_current_power != None:
-                plt.axhline(y=actual_current_power, color=actual_color, linestyle='dashed', linewidth=1, alpha=0.7)
-                plt.plot(actual_last_updated, actual_current_power, 'o', color=actual_color)
+                artists['actual_current'] = ax.axhline(y=actual_current_power, color=actual_color, linestyle='dashed', linewidth=1, alpha=0.7)
+                artists['actual_current_marker'], = ax.plot(actual_last_updated, actual_current_power, 'o', color=actual_color)
 
-                plt.text(1.01, actual_current_power, '%.2f kW' % actual_current_power, transform=trans,
-                         horizontalalignment = 'left',
-                         verticalalignment = 'center',
-                         color=actual_color)
+                artists['actual_current_label'] = ax.text(1.01, actual_current_power, '%.2f kW' % actual_current_power,
+                                                          transform=ax.get_yaxis_transform(),
+                                                          horizontalalignment = 'left',
+                                                          verticalalignment = 'center',
+                                                          color=actual_color)
 
         #----------------------------- Sun times ------------------------------#
 
         # - More top margin for labels
-        forecast_data_range = max(forecast['value']) - min(forecast['value'])
-        forecast_ymin = min(forecast['value']) - 0.05*forecast_data_range # default bottom margin
-        forecast_ymax = max(forecast['value']) + 0.10*forecast_data_range # more top margin
-
         if time_view in ('past', 'today'):
-            actual_data_range = max(actual['value']) - min(actual['value'])
-            actual_ymin = min(actual['value']) - 0.05*actual_data_range # default bottom margin
-            actual_ymax = max(actual['value']) + 0.10*actual_data_range # more top margin
-
-            ymin = min(forecast_ymin, actual_ymin)
-            ymax = max(forecast_ymax, actual_ymax)
-
+            ax.set_ylim(_y_limits(forecast['value'], actual_value))
         elif time_view == 'future':
-            ymin = forecast_ymin
-            ymax = forecast_ymax
+            ax.set_ylim(_y_limits(forecast['value']))
 
-        plt.ylim(ymin,ymax)
+        ax_sun = ax.twiny()
+        ax_sun.set_xlim(forecast['time'][0], forecast['time'][-1])
 
-        plt.twiny()
-        plt.xlim(forecast['time'][0], forecast['time'][-1])
-
-        del sun_times['dawn']
-        del sun_times['dusk']
+        sun_times = {key: value for key, value in sun_times.items() if key not in ('dawn', 'dusk')}
         plot_sun_times = sun_times.copy()
         for old_key in sun_times:
             new_key = old_key + '\n' + sun_times[old_key].strftime("%Hu%M")
             plot_sun_times[new_key] = sun_times[old_key]
 
-        plt.xticks(ticks=list(plot_sun_times.values()), labels=plot_sun_times.keys())
+        ax_sun.set_xticks(list(plot_sun_times.values()))
+        ax_sun.set_xticklabels(list(plot_sun_times.keys()))
 
-        plt.gca().tick_params(axis='x', direction='in',pad=-28)
+        ax_sun.tick_params(axis='x', direction='in',pad=-28)
 
         #------------------------------- Table --------------------------------#
 
@@ -200,10 +292,13 @@ class SolarPlot:
         rows.append([r'$\bf{Elia\ Predictions}$','',''])
         elia_row = len(rows)-1
         rows.append(['Total production', '%.2f' % predicted_total_kwh, 'kWh'])
+        table_rows['predicted_total_kwh'] = len(rows)-1
         if predicted_current_power != None:
             rows.append(['Current power', '%.2f' % predicted_current_power, 'kW'])
+            table_rows['predicted_current_power'] = len(rows)-1
         if predicted_current_kwh != None:
             rows.append(['Current production', '%.2f' % predicted_current_kwh, 'kWh'])
+            table_rows['predicted_current_kwh'] = len(rows)-1
         rows.append(['','',''])
 
         # Actuals
@@ -214,11 +309,14 @@ class SolarPlot:
         if time_view == 'today':
             if actual_current_power != None:
                 rows.append(['Current power', '%.2f' % actual_current_power, 'kW'])
+                table_rows['actual_current_power'] = len(rows)-1
             if actual_current_kwh != None:
                 rows.append(['Current production', '%.2f' % actual_current_kwh, 'kWh'])
+                table_rows['actual_current_kwh'] = len(rows)-1
             if actual_last_updated != None:
                 rows.append(['Last updated', actual_last_updated.strftime("%Hu%M"), ''])
                 last_update_row = len(rows)-1
+                table_rows['actual_last_updated'] = last_update_row
 
         if time_view == 'past':
             rows.append(['Total production', '%.2f' % actual_total_kwh, 'kWh'])
@@ -231,9 +329,10 @@ class SolarPlot:
         width = 0.57
         height = 0.35
 
-        t = plt.table(rows, edges='open', cellLoc='left', bbox=[x0, y0, width, height])
+        t = ax_sun.table(rows, edges='open', cellLoc='left', bbox=[x0, y0, width, height])
         t.auto_set_font_size(False)
         t.auto_set_column_width((0,1,3))
+        artists['table'] = t
 
         # Format cells
         t[elia_row, 0].set_text_props(color=forecast_color)
@@ -251,12 +350,7 @@ class SolarPlot:
 
         #----------------------------------------------------------------------#
 
-        # Progress print
-        if self.verbose:
-            print(GREEN + 'Done')
-
-        #plt.savefig('plot.png')
-        #plt.show()
+        return figure, artists, table_rows
 
 
     def power_flow(self, component_power, component_status, connections):
@@ -268,7 +362,13 @@ class SolarPlot:
         component_power     (dict) : {name (string) : power (float) [kW]}
         component_status    (dict) : {name (string) : status (string)}
         connections         (list)
+
+        Returns
+        -------
+        figure  (matplotlib.Figure)
         '''
+        import matplotlib.pyplot as plt
+
         # Progress print
         if self.verbose:
             print('Plotting power flow... ', end='')
@@ -283,7 +383,7 @@ class SolarPlot:
 
         # Create figure
         cm = 1/2.54 # inch
-        plt.figure(figsize=(15*cm,10*cm))
+        figure = plt.figure(figsize=(15*cm,10*cm))
 
         # Plot icons
         icon_properties = {'fontproperties': fp,
@@ -344,5 +444,183 @@ class SolarPlot:
         if self.verbose:
             print(GREEN + 'Done')
 
-        #plt.savefig('plot.png')
-        #plt.show()
+        return figure
+
+
+class LiveSolarPlot(SolarPlot):
+    '''
+    Solar power plot of today that is updated in place
+
+    The figure is only built on the first call of solar_power (and again when
+    the date changes). Later calls update the data of the existing artists
+    (lines, current time, current values and table values) and only redraw
+    these artists on top of a saved background (blitting). Everything else is
+    only redrawn when the y-axis range changes or the window is resized.
+    '''
+    def __init__(self, verbose=True, debug=False, backend=None):
+        super().__init__(verbose=verbose, debug=debug, backend=backend)
+
+        self.figure = None
+        self.date = None
+        self.artists = {} # {name : artist}, see SolarPlot._solar_power_figure
+        self.table_values = {} # {argument name : table cell text}
+        self.background = None # figure without artists
+        self.shown = False
+
+
+    def solar_power(self, time_view, tz, sun_times, local_capacity,
+                    forecast, predicted_total_kwh,
+                    predicted_current_power=None, predicted_current_kwh=None,
+                    actual=None, actual_current_power=None, actual_current_kwh=None, actual_last_updated=None, actual_total_kwh=None):
+        '''
+        Build or update the plot (arguments see SolarPlot.solar_power)
+
+        Only time view 'today' is supported, all current values are required.
+
+        Returns
+        -------
+        figure  (matplotlib.Figure) : same figure for every call of the same date
+        '''
+        if time_view != 'today':
+            raise Exception(RED + 'Live plot only supports today')
+
+        current_values = [predicted_current_power, predicted_current_kwh, actual_current_power, actual_current_kwh, actual_last_updated]
+        if any(value == None for value in current_values):
+            raise Exception(RED + 'Live plot needs all current values')
+
+        date = forecast['time'][0].date()
+
+        # Build figure for new date
+        if self.figure == None or date != self.date:
+            # Progress print
+            if self.verbose:
+                print('Plotting solar power... ', end='')
+
+            import matplotlib.pyplot as plt
+
+            if self.figure != None:
+                plt.close(self.figure)
+
+            self.figure, self.artists, table_rows = self._solar_power_figure(time_view, tz, sun_times, local_capacity,
+                                                                             forecast, predicted_total_kwh,
+                                                                             predicted_current_power, predicted_current_kwh,
+                                                                             actual, actual_current_power, actual_current_kwh,
+                                                                             actual_last_updated)
+            self.date = date
+            self.background = None
+            self.shown = False
+
+            # Artists that change are not part of the background, they are drawn by _blit
+            table = self.artists.pop('table')
+            for artist in self.artists.values():
+                artist.set_animated(True)
+
+            # The table stays in the background, except for its values. Table cells always draw
+            # their text, so values are transparent in the background (this keeps the column widths).
+            self.table_values = {name: table[row, 1].get_text() for name, row in table_rows.items()}
+            for text in self.table_values.values():
+                text.set_alpha(0)
+
+            # Every full redraw (resize, new y-axis range) saves a new background
+            self.figure.canvas.mpl_connect('draw_event', self._on_draw)
+
+        # Update data of existing figure
+        else:
+            # Progress print
+            if self.verbose:
+                print('Updating solar power plot... ', end='')
+
+            datetime_now = datetime.datetime.now(tz=tz)
+            actual_time, actual_value = _actual_line_data(actual, actual_current_power, actual_last_updated)
+
+            # Lines
+            self.artists['forecast'].set_data(forecast['time'], forecast['value'])
+            self.artists['actual'].set_data(actual_time, actual_value)
+
+            # Current time
+            self.artists['now'].set_xdata([datetime_now, datetime_now])
+            self.artists['now_label'].set_x(datetime_now)
+            self.artists['now_label'].set_text(datetime_now.strftime('%Hu%M'))
+
+            # Current predicted power
+            self.artists['predicted_current'].set_ydata([predicted_current_power, predicted_current_power])
+            self.artists['predicted_current_marker'].set_data([datetime_now], [predicted_current_power])
+            self.artists['predicted_current_label'].set_y(predicted_current_power)
+            self.artists['predicted_current_label'].set_text('%.2f kW' % predicted_current_power)
+
+            # Current actual power
+            self.artists['actual_current'].set_ydata([actual_current_power, actual_current_power])
+            self.artists['actual_current_marker'].set_data([actual_last_updated], [actual_current_power])
+            self.artists['actual_current_label'].set_y(actual_current_power)
+            self.artists['actual_current_label'].set_text('%.2f kW' % actual_current_power)
+
+            # Table
+            self.table_values['predicted_total_kwh'].set_text('%.2f' % predicted_total_kwh)
+            self.table_values['predicted_current_power'].set_text('%.2f' % predicted_current_power)
+            self.table_values['predicted_current_kwh'].set_text('%.2f' % predicted_current_kwh)
+            self.table_values['actual_current_power'].set_text('%.2f' % actual_current_power)
+            self.table_values['actual_current_kwh'].set_text('%.2f' % actual_current_kwh)
+            self.table_values['actual_last_updated'].set_text(actual_last_updated.strftime("%Hu%M"))
+
+            # New y-axis range needs a full redraw
+            ax = self.artists['forecast'].axes
+            ylim = _y_limits(forecast['value'], actual_value)
+            if ylim != ax.get_ylim():
+                ax.set_ylim(ylim)
+                self.background = None
+
+        self._blit()
+
+        # Progress print
+        if self.verbose:
+            print(GREEN + 'Done')
+
+        return self.figure
+
+
+    def wait(self, seconds):
+        '''
+        Show the plot and keep the window responsive for a while
+
+        Unlike plt.pause, this does not redraw the whole figure.
+
+        Arguments
+        ---------
+        seconds (float)
+        '''
+        import matplotlib.pyplot as plt
+
+        if not self.shown:
+            plt.show(block=False)
+            self.shown = True
+
+        self.figure.canvas.start_event_loop(seconds)
+
+
+    def _on_draw(self, event):
+        # Save figure without the changing artists, then draw them on top
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+
+
+    def _draw_artists(self):
+        for artist in self.artists.values():
+            self.figure.draw_artist(artist)
+
+        for text in self.table_values.values():
+            text.set_alpha(None)
+            self.figure.draw_artist(text)
+            text.set_alpha(0)
+
+
+    def _blit(self):
+        canvas = self.figure.canvas
+
+        if self.background == None:
+            canvas.draw() # full redraw, saves background (see _on_draw)
+        else:
+            canvas.restore_region(self.background)
+            self._draw_artists()
+            canvas.blit(self.figure.bbox)
+
+        canvas.flush_events()
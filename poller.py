@@ -0,0 +1,168 @@
+#! python3
+
+import time
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from color import BLUE, RED, GREEN, YELLOW
+
+# Interval of a job whose interval function fails before returning once [s]
+default_interval = 60
+
+
+def print_time_prefix():
+    now = datetime.datetime.now()
+    print('[' + now.strftime('%H:%M:%S') + ']', end=' ')
+
+
+class Job:
+    '''
+    Periodic job, with statistics
+    '''
+    def __init__(self, name, function, interval, offset=0):
+        '''
+        Arguments
+        ---------
+        name        (string)
+        function    (callable)  : blocking function, runs in its own thread
+        interval    (float)     : time between ticks [s], or a function without arguments that returns it
+                                  (called after every run, so the interval can change while running)
+        offset      (float)     : delay of the first tick [s]
+        '''
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.offset = offset
+        self.last_interval = None # last interval returned by an interval function
+
+        # Statistics
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0    # ticks skipped because the previous run was still busy
+        self.overruns = 0   # runs that missed their deadline (next tick)
+        self.total_duration = 0
+        self.max_duration = 0
+
+        # One thread per job, so a slow job never delays the others
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+
+    def get_interval(self):
+        '''
+        Returns
+        -------
+        interval    (float) : time until the next tick [s]
+        '''
+        if not callable(self.interval):
+            return self.interval
+
+        self.last_interval = self.interval()
+        return self.last_interval
+
+
+class PollingEngine:
+    '''
+    Run blocking jobs (API requests, PLC writes) independently on fixed-rate ticks
+
+    Each tick is scheduled one interval after the previous tick (not after the
+    end of the run), so delays do not accumulate. The deadline of each run is
+    the next tick: when a run takes longer, the ticks that passed are skipped
+    (and counted).
+    '''
+    def __init__(self, verbose=True, info=False, debug=False):
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        self.jobs = []
+
+
+    def add_job(self, name, function, interval, offset=0):
+        '''
+        Arguments
+        ---------
+        see Job
+        '''
+        self.jobs.append(Job(name, function, interval, offset))
+
+
+    def run(self):
+        '''
+        Run all jobs until interrupted (KeyboardInterrupt)
+        '''
+        try:
+            asyncio.run(self._run_all())
+        except KeyboardInterrupt:
+            print('\n' + 'Stopped')
+        finally:
+            for job in self.jobs:
+                job.executor.shutdown(wait=False)
+
+            if self.info:
+                self.print_statistics()
+
+
+    def print_statistics(self):
+        print('\n' + BLUE + 'Polling Statistics')
+        for job in self.jobs:
+            mean_duration = job.total_duration / job.runs if job.runs > 0 else 0
+            print('%s runs: %d, errors: %d, skipped ticks: %d, overruns: %d, duration: %.2f s mean / %.2f s max'
+                  % (job.name.ljust(12), job.runs, job.errors, job.skipped, job.overruns, mean_duration, job.max_duration))
+
+
+    async def _run_all(self):
+        start = time.monotonic()
+        await asyncio.gather(*[self._run_job(job, start) for job in self.jobs])
+
+
+    async def _run_job(self, job, start):
+        loop = asyncio.get_running_loop()
+        tick_time = start + job.offset
+
+        while True:
+            # Wait for tick
+            await asyncio.sleep(max(0, tick_time - time.monotonic()))
+
+            # Run job (in its own thread)
+            run_start = time.monotonic()
+            try:
+                await loop.run_in_executor(job.executor, job.function)
+            except Exception as ex:
+                job.errors += 1
+                print_time_prefix()
+                print(RED + '%s: ' % job.name + str(ex))
+            else:
+                if self.debug:
+                    print_time_prefix()
+                    print(GREEN + '%s: Done (%.2f s)' % (job.name, time.monotonic() - run_start))
+            run_end = time.monotonic()
+
+            # Statistics
+            duration = run_end - run_start
+            job.runs += 1
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
+
+            # Next tick, skip ticks that already passed (deadline missed)
+            try:
+                interval = job.get_interval()
+            except Exception as ex:
+                # Keep the last interval (a failing interval function must not stop the other jobs)
+                interval = job.last_interval or default_interval
+                job.errors += 1
+                print_time_prefix()
+                print(RED + '%s: Interval: ' % job.name + str(ex) + ', next tick in %g s' % interval)
+            deadline = tick_time + interval
+            if run_end > deadline:
+                job.overruns += 1
+                missed = int((run_end - deadline) // interval) + 1
+                job.skipped += missed
+                deadline += missed * interval
+
+                if self.verbose:
+                    print_time_prefix()
+                    print(YELLOW + '%s: Deadline missed (%.2f s), %d tick(s) skipped' % (job.name, duration, missed))
+
+            tick_time = deadline
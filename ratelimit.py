@@ -0,0 +1,225 @@
+#! python3
+
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+
+import pytz
+
+from color import RED
+
+
+class RequestBudget:
+    '''
+    Client-side rate limiter for an API with a daily request quota
+
+    Combines a token bucket (spreads requests over the day) with a daily
+    request counter. State is kept per API key in a small JSON file, so all
+    processes using the same key (main.py, loop.py, scripts) share one budget.
+
+    Priorities:
+    - 'live'     : may use the whole daily budget
+    - 'backfill' : refused once only 'reserve' requests are left for today
+    '''
+    def __init__(self, key, daily_quota=300, reserve=50, burst=100, max_wait=600, tz='Europe/Brussels',
+                 state_file='cache/request_budget.json'):
+        '''
+        Arguments
+        ---------
+        key         (string)    : API key (only a hash is stored)
+        daily_quota (int)       : maximum number of requests per day
+        reserve     (int)       : requests kept for 'live' calls
+        burst       (int)       : token bucket capacity (requests that can be done without waiting),
+                                  keep the default: the bucket is shared, a smaller value in one process
+                                  drops the requests saved by the others
+        max_wait    (float)     : maximum time to wait for a token [s]
+        tz          (string)    : timezone in which the daily quota resets at midnight (site timezone, pytz format)
+        state_file  (string)    : file shared between processes
+        '''
+        self.key = hashlib.sha1(key.encode()).hexdigest()[:16]
+        self.daily_quota = daily_quota
+        self.reserve = reserve
+        self.burst = burst
+        self.max_wait = max_wait
+        self.tz = tz
+        self.state_file = state_file
+
+        self.rate = daily_quota / (24*3600) # tokens per second
+
+        self._lock = threading.Lock() # threads within this process
+        self._lock_file = state_file + '.lock' # other processes
+
+        os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+
+
+    def acquire(self, priority='live', max_wait=None):
+        '''
+        Take one request from the budget, wait for the token bucket if needed
+
+        Arguments
+        ---------
+        priority    (string)    : 'live' or 'backfill'
+        max_wait    (float)     : maximum time to wait for a token [s], self.max_wait if None
+        '''
+        max_wait = self.max_wait if max_wait == None else max_wait
+        deadline = time.time() + max_wait
+
+        while True:
+            with self._locked():
+                state = self._read_state()
+                self._refill(state)
+
+                # Daily quota
+                remaining = self.daily_quota - state['used']
+                if remaining <= 0:
+                    raise Exception(RED + 'Daily request budget exhausted')
+                if priority == 'backfill' and remaining <= self.reserve:
+                    raise Exception(RED + 'Daily request budget reserved for live requests')
+
+                # Token bucket
+                if state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    state['used'] += 1
+                    self._write_state(state)
+                    return
+
+                wait = (1 - state['tokens']) / self.rate
+
+            if time.time() + wait > deadline:
+                raise Exception(RED + 'Request rate limit: no token available within %g s' % max_wait)
+
+            time.sleep(wait)
+
+
+    def check(self, count, priority='live'):
+        '''
+        Check that a number of requests fits in today's budget, before doing any of them
+
+        Arguments
+        ---------
+        count       (int)       : number of requests
+        priority    (string)    : 'live' or 'backfill'
+
+        Returns
+        -------
+        wait    (float) : expected time to wait for the tokens of all requests [s]
+        '''
+        with self._locked():
+            state = self._read_state()
+            self._refill(state)
+
+        remaining = self.daily_quota - state['used']
+        if priority == 'backfill':
+            remaining -= self.reserve
+        if remaining < count:
+            raise Exception(RED + 'Daily request budget too low: %d requests needed, %d left' % (count, max(0, remaining)))
+
+        return max(0, count - state['tokens']) / self.rate
+
+
+    def remaining(self):
+        '''
+        Returns
+        -------
+        remaining   (int)   : requests left for today (all processes together)
+        '''
+        with self._locked():
+            state = self._read_state()
+            self._refill(state)
+
+        return self.daily_quota - state['used']
+
+
+    def tokens(self):
+        '''
+        Returns
+        -------
+        tokens  (float) : requests that can be done now without waiting (token bucket)
+        '''
+        with self._locked():
+            state = self._read_state()
+            self._refill(state)
+
+        return state['tokens']
+
+
+    def _refill(self, state):
+        '''
+        Reset daily counter on a new day and add tokens for elapsed time
+        '''
+        now = time.time()
+        today = datetime.datetime.now(pytz.timezone(self.tz)).strftime('%Y-%m-%d')
+
+        if state['date'] != today:
+            state['date'] = today
+            state['used'] = 0
+
+        state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated']) * self.rate)
+        state['updated'] = now
+
+
+    def _read_state(self):
+        try:
+            with open(self.state_file, 'r') as file:
+                all_states = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            all_states = {}
+
+        default = {'date': None, 'used': 0, 'tokens': self.burst, 'updated': time.time()}
+        return all_states.get(self.key, default)
+
+
+    def _write_state(self, state):
+        try:
+            with open(self.state_file, 'r') as file:
+                all_states = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            all_states = {}
+
+        all_states[self.key] = state
+
+        temp_file = '%s.%d.tmp' % (self.state_file, os.getpid())
+        with open(temp_file, 'w') as file:
+            json.dump(all_states, file, indent=4)
+        os.replace(temp_file, self.state_file)
+
+
+    def _locked(self):
+        return _FileLock(self._lock_file, self._lock)
+
+
+class _FileLock:
+    '''
+    Lock shared between threads (threading.Lock) and processes (lock file)
+    '''
+    def __init__(self, path, thread_lock, stale_after=10):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.stale_after = stale_after # [s], lock left behind by a crashed process
+
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                time.sleep(0.01)
+
+
+    def __exit__(self, *args):
+        try:
+            os.remove(self.path)
+        finally:
+            self.thread_lock.release()
@@ -0,0 +1,148 @@
+#! python3
+
+# Render forecast vs actual charts to files for a range of dates
+#   py render.py YYYY-MM-DD YYYY-MM-DD [png|svg]
+# Charts are saved as plots/YYYY-MM-DD.png (or .svg), rendered in parallel (one process per CPU)
+# The sites list, SolarEdge actuals and Elia forecasts are fetched once for the whole range (main process),
+# today is rendered in the main process (its actuals are synced again, only one process writes to the store)
+
+import os
+import sys
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from color import RED, GREEN
+
+output_folder = 'plots'
+
+# Per process (created once per worker, see init_worker)
+engine = None
+plot = None
+
+
+def init_worker(sites):
+    '''
+    Arguments
+    ---------
+    sites   (list)  : site metadata, see SolarEdgeConnector.sites
+    '''
+    global engine, plot
+
+    from engine import SolarEngine
+    from plot import SolarPlot
+
+    engine = SolarEngine(sites=sites, verbose=False)
+    plot = SolarPlot(verbose=False, backend='Agg') # headless
+
+
+def render(date, file_format, elia_data):
+    '''
+    Render chart for one date (in worker process)
+
+    Arguments
+    ---------
+    date        (date)
+    file_format (string)    : 'png' or 'svg'
+    elia_data   (dict)      : see EliaConnector.get_chart_data
+
+    Returns
+    -------
+    path    (string)
+    '''
+    result = engine.run(date, elia_data)
+    figure = engine.plot(result, plot)
+
+    path = os.path.join(output_folder, date.strftime('%Y-%m-%d') + '.' + file_format)
+    plot.save(figure, path) # also closes the figure (no memory growth)
+
+    return path
+
+
+def elia_day(df, date, local_tz):
+    '''
+    Arguments
+    ---------
+    df          (pandas.DataFrame)  : chart data of one region, see EliaConnector.get_chart_data_bulk
+    date        (date)
+    local_tz    (pytz.timezone)
+
+    Returns
+    -------
+    data    (dict)  : chart data of date (midnight to midnight), see EliaConnector.get_chart_data
+    '''
+    start = local_tz.localize(datetime.datetime.combine(date, datetime.time()))
+    end = local_tz.localize(datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time()))
+    day = df[(df.index >= start) & (df.index <= end)]
+
+    return {'time': day.index, 'MostRecentForecast': day['MostRecentForecast'].values, 'MonitoredCapacity': day['MonitoredCapacity'].values}
+
+
+if __name__ == '__main__':
+    ############################# Process Arguments ############################
+
+    try:
+        date_from = datetime.datetime.strptime(sys.argv[1], '%Y-%m-%d').date()
+        date_to = datetime.datetime.strptime(sys.argv[2], '%Y-%m-%d').date()
+    except (IndexError, ValueError):
+        print(RED + 'Syntax: render.py YYYY-MM-DD YYYY-MM-DD [png|svg]')
+        sys.exit()
+
+    file_format = sys.argv[3] if len(sys.argv) > 3 else 'png'
+    if file_format not in ('png', 'svg'):
+        print(RED + 'Unsupported format: %s' % file_format)
+        sys.exit()
+
+    dates = [date_from + datetime.timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    ############################ Sync SolarEdge Data ###########################
+
+    # Fetch actuals for the whole range at once (few long requests instead of one per date),
+    # workers then read them from the local store
+    from engine import SolarEngine
+    main_engine = SolarEngine()
+
+    print('Syncing SolarEdge data... ', end='')
+    main_engine.sec.get_sites_list()
+
+    today = datetime.date.today()
+    last_date = min(date_to, today)
+    if date_from <= last_date:
+        main_engine.store.sync_site_power(main_engine.sec, 0, date_from.strftime('%Y-%m-%d 00:00:00'), last_date.strftime('%Y-%m-%d 23:59:59'))
+    if date_from < today:
+        last_past_date = min(date_to, today - datetime.timedelta(days=1))
+        main_engine.store.sync_site_energy(main_engine.sec, 0, date_from.strftime('%Y-%m-%d'), last_past_date.strftime('%Y-%m-%d'))
+    print(GREEN + 'Done')
+
+    ############################ Get Elia Forecasts ############################
+
+    # One bulk request for the whole range instead of one request per date
+    print('Getting Elia forecasts... ', end='')
+    df = main_engine.ec.get_chart_data_bulk(date_from.strftime('%Y-%m-%d'), (date_to + datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
+                                            [main_engine.region], tz=main_engine.tz).loc[main_engine.region]
+    elia_data = {date: elia_day(df, date, main_engine.local_tz) for date in dates}
+    print(GREEN + 'Done')
+
+    ################################### Render #################################
+
+    print('Rendering %d charts... ' % len(dates))
+
+    with ProcessPoolExecutor(initializer=init_worker, initargs=(main_engine.sec.sites,)) as executor:
+        futures = {executor.submit(render, date, file_format, elia_data[date]): date for date in dates if date != today}
+
+        for future in as_completed(futures):
+            try:
+                print(GREEN + future.result())
+            except Exception as ex:
+                print(RED + '%s: ' % futures[future].strftime('%Y-%m-%d') + str(ex))
+
+    # Today in this process (only one process syncs today's actuals)
+    if today in dates:
+        init_worker(main_engine.sec.sites)
+        try:
+            print(GREEN + render(today, file_format, elia_data[today]))
+        except Exception as ex:
+            print(RED + '%s: ' % today.strftime('%Y-%m-%d') + str(ex))
+
+    print(GREEN + 'Done')
@@ -0,0 +1,69 @@
+#! python3
+
+# Long running service: keeps SolarEngine (connectors, site metadata) warm
+# and serves results as JSON
+#   GET /                   today
+#   GET /?date=YYYY-MM-DD   any date
+
+import re
+import sys
+import json
+import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from color import GREEN
+from engine import SolarEngine
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''
+    Handle one request (requests are handled one at a time)
+    '''
+    engine = None # SolarEngine, shared by all requests
+
+    def do_GET(self):
+        # Date argument, today unless specified
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            if 'date' in query:
+                date = datetime.datetime.strptime(query['date'][0], '%Y-%m-%d').date()
+            else:
+                date = datetime.date.today()
+        except ValueError:
+            self._send(400, {'error': 'Incorrect date format. Syntax: YYYY-MM-DD'})
+            return
+
+        # Get results
+        try:
+            result = self.engine.run(date)
+        except Exception as ex:
+            self._send(500, {'error': re.sub(r'\x1b\[[0-9;]*m', '', str(ex))}) # without color codes
+            return
+
+        self._send(200, self.engine.summary(result))
+
+
+    def _send(self, status, data):
+        body = json.dumps(data, indent=4).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    # Port via first argument, 8080 by default
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+
+    RequestHandler.engine = SolarEngine(verbose=False)
+
+    server = HTTPServer(('localhost', port), RequestHandler)
+    print(GREEN + 'Serving on http://localhost:%d' % port)
+
+    # Serve until stopped by KeyboardInterrupt
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\n' + 'Stopped')
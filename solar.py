@@ -7,10 +7,20 @@ import pytz
 
 from color import GREEN, BLUE
 
+# Columns of a sun times table
+sun_events = ('dawn', 'sunrise', 'noon', 'sunset', 'dusk')
+
+epoch = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+missing = -2**63 # table value of an event that does not occur (e.g. no dusk in polar summer)
+
 
 class SolarTimes:
     '''
     Get solar times
+
+    Results are cached per (tz, lat, lon, date). For many dates, a whole year
+    can be calculated at once with get_year_table, lookups of that year are
+    then served from the table without astral calculations.
     '''
     def __init__(self, verbose=True, info=False, debug=False):
         # Verbosity
@@ -18,6 +28,10 @@ class SolarTimes:
         self.info = info
         self.debug = debug
 
+        # Cache
+        self.cache = {} # {(tz, lat, lon, date) : sun_times}
+        self.tables = {} # {(tz, lat, lon, year) : table}, see get_year_table
+
 
     def get_times(self, tz, lat, lon, date):
         '''
@@ -32,17 +46,26 @@ class SolarTimes:
 
         Returns
         -------
-        sun_times (dict)
+        sun_times (dict)    : {event : datetime (timezone aware)}, a new dict every call
         '''
         # Progress print
         if self.verbose:
             print('Getting solar times... ', end='')
 
-        loc = astral.LocationInfo('Brussels', 'Belgium', tz, lat, lon)
+        key = (tz, lat, lon, date)
+        if key not in self.cache:
+            year = (tz, lat, lon, date.year)
+            day = date.timetuple().tm_yday - 1
 
-        from astral.sun import sun
-        local_tz = pytz.timezone(tz)
-        sun_times = sun(loc.observer, date=date, tzinfo=local_tz)
+            # From precomputed year
+            if year in self.tables and missing not in self.tables[year][day]:
+                self.cache[key] = self._from_table_row(self.tables[year][day], tz)
+
+            # Calculate
+            else:
+                self.cache[key] = self._calculate(tz, lat, lon, date)
+
+        sun_times = dict(self.cache[key]) # copy, callers may change it
 
         # Print info
         if self.info:
@@ -61,6 +84,88 @@ class SolarTimes:
         return sun_times
 
 
+    def get_year_table(self, tz, lat, lon, year):
+        '''
+        Solar times of every day of a year (calculated once)
+
+        Arguments
+        ---------
+        tz      (string)    : timezone (in tz format)
+        lat     (float)     : latitude
+        lon     (float)     : longitude
+        year    (int)
+
+        Returns
+        -------
+        table   (numpy.ndarray) : int64 [days, events], microseconds since epoch (UTC),
+                                  row = day of year - 1, columns see sun_events,
+                                  events that do not occur are set to missing
+        '''
+        import numpy as np
+
+        key = (tz, lat, lon, year)
+        if key not in self.tables:
+            # Progress print
+            if self.verbose:
+                print('Calculating solar times of %d... ' % year, end='')
+
+            first_day = datetime.date(year, 1, 1)
+            days = (datetime.date(year + 1, 1, 1) - first_day).days
+
+            table = np.full((days, len(sun_events)), missing, dtype=np.int64)
+            for day in range(days):
+                date = first_day + datetime.timedelta(days=day)
+                try:
+                    sun_times = self._calculate(tz, lat, lon, date)
+                except ValueError:
+                    # Sun does not reach an event's elevation, calculate events separately
+                    sun_times = self._calculate_events(tz, lat, lon, date)
+
+                for column, event in enumerate(sun_events):
+                    if event in sun_times:
+                        table[day, column] = (sun_times[event] - epoch) // datetime.timedelta(microseconds=1)
+
+            self.tables[key] = table
+
+            # Progress print
+            if self.verbose:
+                print(GREEN + 'Done')
+
+        return self.tables[key]
+
+
+    def _calculate(self, tz, lat, lon, date):
+        loc = astral.LocationInfo('Brussels', 'Belgium', tz, lat, lon)
+
+        from astral.sun import sun
+        local_tz = pytz.timezone(tz)
+        return sun(loc.observer, date=date, tzinfo=local_tz)
+
+
+    def _calculate_events(self, tz, lat, lon, date):
+        # Events one by one, leaving out events that do not occur
+        loc = astral.LocationInfo('Brussels', 'Belgium', tz, lat, lon)
+
+        from astral.sun import dawn, sunrise, noon, sunset, dusk
+        functions = {'dawn': dawn, 'sunrise': sunrise, 'noon': noon, 'sunset': sunset, 'dusk': dusk}
+        local_tz = pytz.timezone(tz)
+
+        sun_times = {}
+        for event in sun_events:
+            try:
+                sun_times[event] = functions[event](loc.observer, date=date, tzinfo=local_tz)
+            except ValueError:
+                pass
+
+        return sun_times
+
+
+    def _from_table_row(self, row, tz):
+        local_tz = pytz.timezone(tz)
+        return {event: (epoch + datetime.timedelta(microseconds=int(row[column]))).astimezone(local_tz)
+                for column, event in enumerate(sun_events)}
+
+
 if __name__ == '__main__':
     st = SolarTimes(verbose=False, info=True)
     today = datetime.date.today()
@@ -1,22 +1,37 @@
 #! python3
 
 import json
+import time
+import random
 import datetime
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
 import urllib3
 urllib3.disable_warnings() # Ignore InsecureRequestWarning
-import pytz
 
 from color import BLUE, RED, GREEN, YELLOW, YELLOW_BRIGHT
+from ratelimit import RequestBudget
+from timeutil import localize
 
 
 class SolarEdgeConnector:
     '''
     Connect and make requests to Solar Edge API
     '''
-    def __init__(self, verbose=True, info=False, debug=False):
+    def __init__(self, verbose=True, info=False, debug=False, timeout=(5, 30), retries=3, backoff=1.0, max_retry_after=60, daily_quota=300, tz='Europe/Brussels'):
+        '''
+        Arguments
+        ---------
+        timeout     (tuple)     : (connect, read) timeout per request [s]
+        retries     (int)       : number of retries on connection errors, timeouts, 429 and 5xx responses
+        backoff     (float)     : base delay between retries [s], doubled every retry (with random jitter)
+        max_retry_after (float) : maximum delay requested by the server (Retry-After header) [s]
+        daily_quota (int)       : maximum number of API requests per day (per API key)
+        tz          (string)    : site timezone, the daily quota resets at its midnight (pytz format)
+        '''
         # API self.root
         self.root = 'https://monitoringapi.solaredge.com'
 
@@ -41,8 +56,28 @@ class SolarEdgeConnector:
         with open('credentials.json', 'r') as file:
             self.credentials = json.load(file)
 
+        # HTTP session (keep-alive, connections are reused between requests)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=3)) # API allows 3 concurrent calls
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+
+        # Request budget (shared by all processes using the same API key)
+        self.budget = RequestBudget(self.credentials['solaredge']['api_key'], daily_quota=daily_quota, tz=tz)
+
+
+    def get_remaining_budget(self):
+        '''
+        Returns
+        -------
+        remaining   (int)   : API requests left for today
+        '''
+        return self.budget.remaining()
+
 
-    def _get_request(self, root, method, parameter=None, debug=False):
+    def _get_request(self, root, method, parameter=None, debug=False, priority='live', max_wait=None):
         '''
         GET request to Solar Edge REST API
 
@@ -53,6 +88,9 @@ class SolarEdgeConnector:
         parameter (list)
 
         debug
+        priority  (string)  : 'live' (current values) or 'backfill' (history),
+                              backfill requests are refused when the daily budget runs low
+        max_wait  (float)   : maximum time to wait for the request budget [s], see RequestBudget.acquire
 
         Returns
         -------
@@ -67,11 +105,33 @@ class SolarEdgeConnector:
         if debug == True:
             print(YELLOW + '[REQUEST] ' + url)
 
-        # Do request
-        try:
-            response = requests.get(url, verify=False)
-        except requests.exceptions.ConnectionError:
-            raise Exception(RED + 'Connection Error')
+        # Do request (retry on transient errors)
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+
+            self.budget.acquire(priority, max_wait)
+
+            try:
+                response = self.session.get(url, verify=False, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise Exception(RED + 'Connection Error')
+                retry_after = None
+            else:
+                if response.status_code not in (429, 500, 502, 503, 504) or last_attempt:
+                    break
+                retry_after = response.headers.get('Retry-After')
+
+            # Wait before retrying (exponential backoff with full jitter, Retry-After of the server up to max_retry_after)
+            if retry_after != None and retry_after.isdigit():
+                delay = min(float(retry_after), self.max_retry_after)
+            else:
+                delay = random.uniform(0, self.backoff * 2**attempt)
+
+            if debug == True:
+                print(YELLOW + '[RETRY] in %.1f s' % delay)
+
+            time.sleep(delay)
 
         # Check HTTP Status Code
         if response.status_code == 200:
@@ -92,12 +152,82 @@ class SolarEdgeConnector:
         elif response.status_code == 404:
             raise Exception(RED + '404 - Not Found')
 
+        elif response.status_code == 429:
+            raise Exception(RED + '429 - Too Many Requests')
+
         elif response.status_code == 500:
             raise Exception(RED + '500 - Internal Server Error')
 
         else:
             raise Exception(RED + 'Unprocessed HTTP Response: %d' % response.status_code)
 
+
+    def _split_time_range(self, start_time, end_time, max_days):
+        '''
+        Split time range in windows the API accepts
+
+        Arguments
+        ---------
+        start_time  (string)    :   YYYY-MM-DD hh:mm:ss
+        end_time    (string)    :   YYYY-MM-DD hh:mm:ss
+        max_days    (int)       :   maximum length of one window [days]
+
+        Returns
+        -------
+        windows (list)  :   [(start_time, end_time)] (strings, same format)
+        '''
+        format = '%Y-%m-%d %H:%M:%S'
+        start = datetime.datetime.strptime(start_time, format)
+        end = datetime.datetime.strptime(end_time, format)
+
+        windows = []
+        while True:
+            window_end = start + datetime.timedelta(days=max_days, seconds=-1)
+            if window_end >= end:
+                windows.append((start.strftime(format), end.strftime(format)))
+                break
+            windows.append((start.strftime(format), window_end.strftime(format)))
+            start = window_end + datetime.timedelta(seconds=1)
+
+        return windows
+
+
+    def _map_requests(self, function, windows):
+        '''
+        Do one request per window, in parallel (API allows 3 concurrent requests)
+
+        The request budget is checked first: when today's budget cannot cover
+        all windows, no request is done. Otherwise requests wait as long as
+        the token bucket needs to refill for all windows.
+
+        Arguments
+        ---------
+        function    (callable)  :   function(start_time, end_time, max_wait) returning json_data
+        windows     (list)      :   see _split_time_range
+
+        Returns
+        -------
+        results (list)  :   json_data per window, in order of windows
+        '''
+        # Check request budget (fail before any request is spent)
+        wait = self.budget.check(len(windows), priority='backfill')
+        max_wait = wait + self.budget.max_wait
+
+        # Print info
+        if self.info and wait > 0:
+            print('\n' + YELLOW + 'Waiting up to %d s for the request budget (%d requests)' % (wait, len(windows)))
+
+        if len(windows) == 1:
+            return [function(*windows[0], max_wait)]
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            return list(executor.map(lambda window: function(*window, max_wait), windows))
+
+
+    def _timezone(self, site_id):
+        # Timezone of site (pytz format), times in API responses are local times of the site
+        return self.sites[site_id]['location']['timeZone']
+
     ################################ Sites API #################################
 
     def get_sites_list(self):
@@ -157,7 +287,7 @@ class SolarEdgeConnector:
         parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
 
         # Do request
-        json_data = self._get_request(self.root, method, parameter, debug=False)
+        json_data = self._get_request(self.root, method, parameter, debug=False, priority='backfill')
 
         # Progress print
         if self.verbose:
@@ -171,6 +301,7 @@ class SolarEdgeConnector:
         Site energy measurements (Wh)
         > can be used to get production for multiple days at a time
         > can also be used to get current production for today, but this makes more sense through 'Site Overview'
+        > limited to one-year period by the API (daily resolution), longer periods are split in multiple requests
 
         Arguments
         ---------
@@ -189,24 +320,24 @@ class SolarEdgeConnector:
 
         # Build request
         method = '/site/%s/energy' % self.sites[site_id]['id'] # /site/SITE_ID/energy
-        parameter = []
-        parameter.append('startDate=%s' % start_date) # mandatory
-        parameter.append('endDate=%s' % end_date) # mandatory
-        #parameter.append('timeUnit=HOUR') # QUARTER_OF_AN_HOUR, HOUR, DAY (default), WEEK, MONTH, YEAR
-        parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
 
-        # Do request
-        json_data = self._get_request(self.root, method, parameter, debug=False)
+        def request(window_start, window_end, max_wait):
+            parameter = []
+            parameter.append('startDate=%s' % window_start[:10]) # mandatory
+            parameter.append('endDate=%s' % window_end[:10]) # mandatory
+            #parameter.append('timeUnit=HOUR') # QUARTER_OF_AN_HOUR, HOUR, DAY (default), WEEK, MONTH, YEAR
+            parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
+            return self._get_request(self.root, method, parameter, debug=False, priority='backfill', max_wait=max_wait)
 
-        # Extract data
+        # Do requests (split in windows of maximum one year)
+        windows = self._split_time_range(start_date + ' 00:00:00', end_date + ' 23:59:59', max_days=365)
+        results = self._map_requests(request, windows)
+
+        # Extract data (days without data yet are left out)
+        values = [entry for json_data in results for entry in json_data['energy']['values'] if entry['value'] != None]
         energy = {}
-        energy['time'] = []
-        energy['value'] = []
-        for entry in json_data['energy']['values']:
-            unaware_dt = datetime.datetime.strptime(entry['date'], '%Y-%m-%d %H:%M:%S')
-            dt = pytz.timezone('Europe/Brussels').localize(unaware_dt) # timezone aware datetime
-            energy['time'].append(dt)
-            energy['value'].append(entry['value'] / 1000) # Wh to kWh
+        energy['time'] = localize([entry['date'] for entry in values], self._timezone(site_id)) # timezone aware datetimes
+        energy['value'] = [entry['value'] / 1000 for entry in values] # Wh to kWh
 
         # Print info
         if self.info:
@@ -228,7 +359,7 @@ class SolarEdgeConnector:
 
         Site power measurements
         - in 15 minutes resolution (QUARTER_OF_AN_HOUR fixed)
-        - limited to one-month period
+        - limited to one-month period by the API, longer periods are split in multiple requests
 
         ! = inverter measurements (solar + battery to house)
 
@@ -249,24 +380,32 @@ class SolarEdgeConnector:
 
         # Build request
         method = '/site/%s/power' % self.sites[site_id]['id'] # /site/SITE_ID/power
-        parameter = []
-        parameter.append('startTime=%s' % start_time.replace(' ','%20')) # mandatory
-        parameter.append('endTime=%s' % end_time.replace(' ','%20')) # mandatory
-        parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
 
-        # Do request
-        json_data = self._get_request(self.root, method, parameter, debug=False)
+        def request(window_start, window_end, max_wait):
+            parameter = []
+            parameter.append('startTime=%s' % window_start.replace(' ','%20')) # mandatory
+            parameter.append('endTime=%s' % window_end.replace(' ','%20')) # mandatory
+            parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
+            return self._get_request(self.root, method, parameter, debug=False, priority='backfill', max_wait=max_wait)
+
+        # Do requests (split in windows of maximum one month)
+        windows = self._split_time_range(start_time, end_time, max_days=28)
+        results = self._map_requests(request, windows)
+
+        # Merge windows
+        values = []
+        dates = set()
+        for json_data in results:
+            for entry in json_data['power']['values']:
+                if entry['date'] not in dates:
+                    dates.add(entry['date'])
+                    values.append(entry)
 
         # Extract data
+        values = [entry for entry in values if entry['value'] != None]
         power = {}
-        power['time'] = []
-        power['value'] = []
-        for entry in json_data['power']['values']:
-            unaware_dt = datetime.datetime.strptime(entry['date'], '%Y-%m-%d %H:%M:%S')
-            dt = pytz.timezone('Europe/Brussels').localize(unaware_dt) # timezone aware datetime
-            if entry['value'] != None:
-                power['time'].append(dt)
-                power['value'].append(entry['value'] / 1000) # W to kW
+        power['time'] = localize([entry['date'] for entry in values], self._timezone(site_id)) # timezone aware datetimes
+        power['value'] = [entry['value'] / 1000 for entry in values] # W to kW
 
         # Print info
         if self.info:
@@ -313,9 +452,7 @@ class SolarEdgeConnector:
         current_production = json_data['overview']['lastDayData']['energy'] # Wh
         last_update_string = json_data['overview']['lastUpdateTime']
 
-        format = '%Y-%m-%d %H:%M:%S'
-        unaware_last_update = datetime.datetime.strptime(last_update_string, format)
-        last_update = pytz.timezone('Europe/Brussels').localize(unaware_last_update) # timezone aware datetime
+        last_update = localize([last_update_string], self._timezone(site_id))[0] # timezone aware datetime
 
         # Print info
         if self.info:
@@ -432,7 +569,7 @@ class SolarEdgeConnector:
         Storage Information
 
         Detailed information from batteries (state of energy, power, lifetime energy)
-        - limited to one-week period
+        - limited to one-week period by the API, longer periods are split in multiple requests
         - in 5 minutes resolution
         > used to get battery history
 
@@ -466,17 +603,28 @@ class SolarEdgeConnector:
 
         # Build request
         method = '/site/%s/storageData' % self.sites[site_id]['id'] # /site/SITE_ID/storageData
-        parameter = []
-        parameter.append('startTime=%s' % start_time.replace(' ','%20')) # mandatory
-        parameter.append('endTime=%s' % end_time.replace(' ','%20')) # mandatory
-        parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
-
-        # Do request
-        json_data = self._get_request(self.root, method, parameter, debug=False)
 
-        # Extract data
-        nr_of_batteries = json_data['storageData']['batteryCount']
-        batteries = json_data['storageData']['batteries']
+        def request(window_start, window_end, max_wait):
+            parameter = []
+            parameter.append('startTime=%s' % window_start.replace(' ','%20')) # mandatory
+            parameter.append('endTime=%s' % window_end.replace(' ','%20')) # mandatory
+            parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
+            return self._get_request(self.root, method, parameter, debug=False, priority='backfill', max_wait=max_wait)
+
+        # Do requests (split in windows of maximum one week)
+        windows = self._split_time_range(start_time, end_time, max_days=7)
+        results = self._map_requests(request, windows)
+
+        # Merge windows (telemetries per battery, by serial number)
+        nr_of_batteries = results[0]['storageData']['batteryCount']
+        batteries = []
+        serial_numbers = {}
+        for json_data in results:
+            for battery in json_data['storageData']['batteries']:
+                if battery['serialNumber'] not in serial_numbers:
+                    serial_numbers[battery['serialNumber']] = len(batteries)
+                    batteries.append(dict(battery, telemetries=[]))
+                batteries[serial_numbers[battery['serialNumber']]]['telemetries'].extend(battery['telemetries'])
 
         battery_data = []
         for battery in batteries:
@@ -484,12 +632,13 @@ class SolarEdgeConnector:
             for entry in battery['telemetries']:
                 for key in entry:
                     if key == 'timeStamp':
-                        unaware_dt = datetime.datetime.strptime(entry[key], '%Y-%m-%d %H:%M:%S')
-                        dt = pytz.timezone('Europe/Brussels').localize(unaware_dt) # timezone aware datetime
-                        battery_data[-1]['time'].append(dt)
+                        battery_data[-1]['time'].append(entry[key])
                     else:
                         battery_data[-1][key].append(entry[key])
 
+            # Timezone aware datetimes (all at once)
+            battery_data[-1]['time'] = localize(battery_data[-1]['time'], self._timezone(site_id))
+
         # DEBUG
         if self.debug:
             for battery in battery_data:
@@ -542,7 +691,7 @@ class SolarEdgeConnector:
         parameter.append('api_key=' + self.credentials['solaredge']['api_key'])
 
         # Do request
-        json_data = self._get_request(self.root, method, parameter, debug=False)
+        json_data = self._get_request(self.root, method, parameter, debug=False, priority='backfill')
 
         # Extract data
         inventory = json_data['Inventory']
@@ -0,0 +1,328 @@
+#! python3
+
+import os
+import time
+import sqlite3
+import datetime
+import threading
+from collections import defaultdict
+
+import pytz
+
+from color import BLUE
+
+
+class TimeSeriesStore:
+    '''
+    Local store for SolarEdge actuals (SQLite)
+
+    Site power, site energy and storage telemetry are stored per site, with
+    timestamps as UNIX time and a 'day' column (partition key, site time zone).
+    Synced days are tracked per table and site, so a sync only requests the
+    days within the requested period that are not stored yet. A day is only
+    marked as synced once it has ended and its data is complete (intervals
+    that are not uploaded yet are requested again, for up to one day).
+    '''
+    # Storage telemetry columns (see SolarEdgeConnector.get_storage_information)
+    storage_columns = ['batteryState', 'stateOfCharge', 'power', 'ACGridCharging', 'internalTemp',
+                       'lifeTimeEnergyCharged', 'lifeTimeEnergyDischarged', 'fullPackEnergyAvailable']
+
+    def __init__(self, path='data/solaredge.sqlite', tz='Europe/Brussels', verbose=True, info=False, debug=False):
+        '''
+        Arguments
+        ---------
+        path    (string)    : SQLite database file
+        tz      (string)    : time zone of the site (pytz format)
+        '''
+        # Verbosity
+        self.verbose = verbose
+        self.info = info
+        self.debug = debug
+
+        self.tz = pytz.timezone(tz)
+
+        # Open database
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock() # connection is shared between threads
+
+        # Create tables
+        self.db.execute('CREATE TABLE IF NOT EXISTS site_power '
+                        '(site_id INTEGER, day TEXT, time INTEGER, value REAL, PRIMARY KEY (site_id, time))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS site_energy '
+                        '(site_id INTEGER, day TEXT, time INTEGER, value REAL, PRIMARY KEY (site_id, time))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS storage '
+                        '(site_id INTEGER, battery INTEGER, day TEXT, time INTEGER, %s, PRIMARY KEY (site_id, battery, time))'
+                        % ', '.join('%s REAL' % column for column in self.storage_columns))
+        self.db.execute('CREATE TABLE IF NOT EXISTS synced_days '
+                        '(name TEXT, site_id INTEGER, day TEXT, PRIMARY KEY (name, site_id, day))')
+
+        for table in ('site_power', 'site_energy', 'storage'):
+            self.db.execute('CREATE INDEX IF NOT EXISTS %s_day ON %s (site_id, day)' % (table, table))
+
+        self.db.commit()
+
+    ################################### Sync ###################################
+
+    def sync_site_power(self, sec, site_id, start_time, end_time):
+        '''
+        Make sure site power for the given period is stored
+
+        Arguments
+        ---------
+        sec         (SolarEdgeConnector)    : with sites list loaded
+        site_id     (int)                   : index in sec.sites
+        start_time  (string)                : YYYY-MM-DD hh:mm:ss
+        end_time    (string)                : YYYY-MM-DD hh:mm:ss
+        '''
+        site = sec.sites[site_id]['id']
+
+        for window_start, window_end in self._missing('site_power', site, start_time, end_time):
+            power = sec.get_site_power(site_id, window_start, window_end)
+            rows = [(site, self._day(t), int(t.timestamp()), value) for t, value in zip(power['time'], power['value'])]
+            with self.lock:
+                self.db.executemany('INSERT OR REPLACE INTO site_power VALUES (?, ?, ?, ?)', rows)
+                self._set_synced('site_power', site, window_start, window_end, resolution=15*60)
+
+
+    def sync_site_energy(self, sec, site_id, start_date, end_date):
+        '''
+        Make sure daily site energy for the given period is stored
+
+        Arguments
+        ---------
+        sec         (SolarEdgeConnector)    : with sites list loaded
+        site_id     (int)                   : index in sec.sites
+        start_date  (string)                : YYYY-MM-DD
+        end_date    (string)                : YYYY-MM-DD
+        '''
+        site = sec.sites[site_id]['id']
+
+        for window_start, window_end in self._missing('site_energy', site, start_date + ' 00:00:00', end_date + ' 23:59:59'):
+            energy = sec.get_site_energy(site_id, window_start[:10], window_end[:10])
+            rows = [(site, self._day(t), int(t.timestamp()), value) for t, value in zip(energy['time'], energy['value'])]
+            with self.lock:
+                self.db.executemany('INSERT OR REPLACE INTO site_energy VALUES (?, ?, ?, ?)', rows)
+                self._set_synced('site_energy', site, window_start, window_end, resolution=24*3600)
+
+
+    def sync_storage_information(self, sec, site_id, start_time, end_time):
+        '''
+        Make sure storage telemetry for the given period is stored
+
+        Arguments
+        ---------
+        sec         (SolarEdgeConnector)    : with sites list loaded
+        site_id     (int)                   : index in sec.sites
+        start_time  (string)                : YYYY-MM-DD hh:mm:ss
+        end_time    (string)                : YYYY-MM-DD hh:mm:ss
+        '''
+        site = sec.sites[site_id]['id']
+
+        for window_start, window_end in self._missing('storage', site, start_time, end_time):
+            battery_data = sec.get_storage_information(site_id, window_start, window_end)
+            rows = []
+            for battery, data in enumerate(battery_data):
+                for i, t in enumerate(data['time']):
+                    values = [data[column][i] if column in data else None for column in self.storage_columns]
+                    rows.append([site, battery, self._day(t), int(t.timestamp())] + values)
+            with self.lock:
+                self.db.executemany('INSERT OR REPLACE INTO storage VALUES (%s)' % ', '.join('?'*(4 + len(self.storage_columns))), rows)
+                self._set_synced('storage', site, window_start, window_end, resolution=5*60)
+
+    ################################## Query ###################################
+
+    def get_site_power(self, sec, site_id, start_time, end_time):
+        '''
+        Site power from store (synced first if needed)
+
+        Arguments
+        ---------
+        see sync_site_power
+
+        Returns
+        -------
+        power   (dict)  :   {'time'  : list of time (datetime),
+                             'value' : list of power (float) [kW]}
+        '''
+        self.sync_site_power(sec, site_id, start_time, end_time)
+
+        rows = self._query('site_power', sec.sites[site_id]['id'], start_time, end_time)
+
+        power = {}
+        power['time'] = [self._datetime(row[0]) for row in rows]
+        power['value'] = [row[1] for row in rows]
+
+        # Print info
+        if self.info:
+            print('\n' + BLUE + 'Site Power Measurements (store)')
+            for i, _ in enumerate(power['time']):
+                print(str(power['time'][i]) + ': ' + str(power['value'][i]))
+
+        return power
+
+
+    def get_site_energy(self, sec, site_id, start_date, end_date):
+        '''
+        Daily site energy from store (synced first if needed)
+
+        Arguments
+        ---------
+        see sync_site_energy
+
+        Returns
+        -------
+        energy   (dict)  :   {'time'  : list of time (datetime),
+                              'value' : list of energy (float) [kWh]}
+        '''
+        self.sync_site_energy(sec, site_id, start_date, end_date)
+
+        rows = self._query('site_energy', sec.sites[site_id]['id'], start_date + ' 00:00:00', end_date + ' 23:59:59')
+
+        energy = {}
+        energy['time'] = [self._datetime(row[0]) for row in rows]
+        energy['value'] = [row[1] for row in rows]
+
+        # Print info
+        if self.info:
+            print('\n' + BLUE + 'Site Energy (store)')
+            for i, _ in enumerate(energy['time']):
+                print(str(energy['time'][i]) + ': ' + str(energy['value'][i]))
+
+        return energy
+
+
+    def get_storage_information(self, sec, site_id, start_time, end_time):
+        '''
+        Storage telemetry from store (synced first if needed)
+
+        Arguments
+        ---------
+        see sync_storage_information
+
+        Returns
+        -------
+        battery_data (list of dicts)    : one dict per battery, see SolarEdgeConnector.get_storage_information
+        '''
+        self.sync_storage_information(sec, site_id, start_time, end_time)
+
+        with self.lock:
+            rows = self.db.execute('SELECT battery, time, %s FROM storage WHERE site_id = ? AND time BETWEEN ? AND ? ORDER BY battery, time'
+                                   % ', '.join(self.storage_columns),
+                                   (sec.sites[site_id]['id'], self._timestamp(start_time), self._timestamp(end_time))).fetchall()
+
+        battery_data = []
+        for row in rows:
+            while len(battery_data) <= row[0]:
+                battery_data.append(defaultdict(list))
+            battery_data[row[0]]['time'].append(self._datetime(row[1]))
+            for column, value in zip(self.storage_columns, row[2:]):
+                battery_data[row[0]][column].append(value)
+
+        return battery_data
+
+    ################################# Helpers ##################################
+
+    def _missing(self, name, site, start_time, end_time):
+        '''
+        Periods within [start_time, end_time] that are not synced yet
+
+        Consecutive days that are not synced are grouped in one period, periods
+        cover whole days (up to now).
+
+        Returns
+        -------
+        windows (list)  :   [(start_time, end_time)] (strings, YYYY-MM-DD hh:mm:ss)
+        '''
+        now = int(time.time())
+        days = self._days(start_time, min(self._timestamp(end_time), now))
+
+        with self.lock:
+            synced = set(row[0] for row in self.db.execute('SELECT day FROM synced_days WHERE name = ? AND site_id = ? AND day BETWEEN ? AND ?',
+                                                           (name, site, days[0], days[-1])).fetchall()) if len(days) > 0 else set()
+
+        # Group consecutive missing days
+        windows = []
+        previous = None
+        for day in days:
+            if day in synced:
+                continue
+            if len(windows) > 0 and previous == self._previous_day(day):
+                windows[-1][1] = day
+            else:
+                windows.append([day, day])
+            previous = day
+
+        if self.verbose and len(windows) > 0:
+            print('Syncing %s (%d period(s))... ' % (name, len(windows)))
+
+        return [(first + ' 00:00:00', self._string(min(self._timestamp(last + ' 23:59:59'), now))) for first, last in windows]
+
+
+    def _set_synced(self, name, site, start_time, end_time, resolution):
+        '''
+        Mark the days of a synced period as synced
+
+        Days that did not end yet are not marked. Days without data up to
+        their last interval (not uploaded yet) are only marked once they
+        ended more than one day ago, until then they are requested again.
+        '''
+        now = int(time.time())
+        last_times = dict(self.db.execute('SELECT day, MAX(time) FROM %s WHERE site_id = ? AND time BETWEEN ? AND ? GROUP BY day' % name,
+                                          (site, self._timestamp(start_time), self._timestamp(end_time))).fetchall())
+
+        days = []
+        for day in self._days(start_time, self._timestamp(end_time)):
+            day_end = self._timestamp(self._next_day(day) + ' 00:00:00')
+            if day_end > now:
+                continue
+            if last_times.get(day, 0) < day_end - resolution and now - day_end < 24*3600:
+                continue
+            days.append((name, site, day))
+
+        self.db.executemany('INSERT OR REPLACE INTO synced_days VALUES (?, ?, ?)', days)
+        self.db.commit()
+
+
+    def _days(self, start_time, end):
+        # Days (YYYY-MM-DD, site time) from start_time up to UNIX time end
+        days = []
+        day = start_time[:10]
+        last = self._string(end)[:10] if end >= self._timestamp(start_time) else ''
+        while day <= last:
+            days.append(day)
+            day = self._next_day(day)
+        return days
+
+
+    def _next_day(self, day):
+        return (datetime.datetime.strptime(day, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+    def _previous_day(self, day):
+        return (datetime.datetime.strptime(day, '%Y-%m-%d') - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+    def _query(self, table, site, start_time, end_time):
+        with self.lock:
+            return self.db.execute('SELECT time, value FROM %s WHERE site_id = ? AND time BETWEEN ? AND ? ORDER BY time' % table,
+                                   (site, self._timestamp(start_time), self._timestamp(end_time))).fetchall()
+
+
+    def _timestamp(self, string):
+        # Site time (YYYY-MM-DD hh:mm:ss) to UNIX time
+        unaware_dt = datetime.datetime.strptime(string, '%Y-%m-%d %H:%M:%S')
+        return int(self.tz.localize(unaware_dt).timestamp())
+
+
+    def _string(self, timestamp):
+        # UNIX time to site time (YYYY-MM-DD hh:mm:ss)
+        return self._datetime(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+    def _datetime(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, tz=self.tz)
+
+
+    def _day(self, dt):
+        return dt.astimezone(self.tz).strftime('%Y-%m-%d')
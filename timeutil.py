@@ -0,0 +1,61 @@
+#! python3
+
+import pytz
+
+
+def localize_index(strings, tz, format='%Y-%m-%d %H:%M:%S'):
+    '''
+    Parse local time strings and make them timezone aware, all at once
+
+    Ambiguous times (end of DST) are taken as standard time and nonexistent
+    times (start of DST) are shifted one hour forward, which is the same
+    moment pytz localize(is_dst=False) gives.
+
+    Arguments
+    ---------
+    strings (list)      : local time strings
+    tz      (string)    : timezone (pytz format)
+    format  (string)    : strptime format
+
+    Returns
+    -------
+    time    (pandas.DatetimeIndex)
+    '''
+    import pandas as pd
+
+    return localize_naive(pd.to_datetime(list(strings), format=format), tz)
+
+
+def localize_naive(time, tz):
+    '''
+    Make local times timezone aware (same rules as localize_index)
+
+    Arguments
+    ---------
+    time    (pandas.DatetimeIndex)  : timezone naive local times
+    tz      (string)                : timezone (pytz format)
+
+    Returns
+    -------
+    time    (pandas.DatetimeIndex)
+    '''
+    import pandas as pd
+
+    return time.tz_localize(pytz.timezone(tz), ambiguous=[False]*len(time), nonexistent=pd.Timedelta(hours=1))
+
+
+def localize(strings, tz, format='%Y-%m-%d %H:%M:%S'):
+    '''
+    Same as localize_index, as a list of datetime (timezone aware)
+
+    Arguments
+    ---------
+    strings (list)      : local time strings
+    tz      (string)    : timezone (pytz format)
+    format  (string)    : strptime format
+
+    Returns
+    -------
+    time    (list)
+    '''
+    return localize_index(strings, tz, format).to_pydatetime().tolist()